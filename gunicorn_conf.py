@@ -0,0 +1,23 @@
+from src.config import settings
+
+bind = f"{settings.api_host}:{settings.api_port}"
+# Runtime tenant and database config changes stay in the worker that served them
+workers = settings.web_concurrency or 1
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+loglevel = settings.log_level.lower()
+
+
+def on_starting(server):
+    """Fetch the embedding model once in the master before workers start"""
+    from src.llm.qwen_client import get_embedding_model
+
+    # ONNX Runtime sessions are not fork-safe, so only the downloaded model
+    # files are kept; each worker builds its own session from the local cache
+    try:
+        # Vanna's default fastembed model
+        get_embedding_model('BAAI/bge-small-en-v1.5')
+    except Exception as e:
+        server.log.warning(f"Could not preload embedding model: {e}")
+    finally:
+        get_embedding_model.cache_clear()
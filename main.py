@@ -1,33 +1,122 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from contextlib import asynccontextmanager
-import os
-import sys
-from dotenv import load_dotenv
+from logging.handlers import QueueHandler, QueueListener
+import asyncio
+import anyio
+import logging
+import orjson
+import queue
+import time
 
+from src.config import settings
+from src.llm.custom_llm import close_llm_http_clients
 from src.routes.text2sql import get_text2sql_router
 from src.service_manager import service_manager
+from src.vanna_service import VannaService
 
-# Add src to path for imports
-sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("access")
 
-# Load environment variables
-load_dotenv()
+# Static response bodies, encoded once at import
+_ROOT_JSON = orjson.dumps({
+    "message": "Text2SQL API with Vanna",
+    "version": "1.0.0",
+    "endpoints": {
+        "ask": "POST /ask - Ask a natural language question",
+        "sql": "POST /sql - Generate SQL only",
+        "execute": "POST /execute - Execute SQL directly",
+        "train": "POST /train - Train the model",
+        "health": "GET /health - Health check",
+        "health_detailed": "GET /health/detailed - Health check with tenant statistics"
+    }
+})
 
-from models import QueryRequest, QueryResponse, TrainingRequest, DatabaseConfig
-from vanna_service import VannaService
+_HEALTH_STATUS = {
+    "status": "healthy",
+    "service": "vanna",
+    "database": "clickhouse"
+}
+_HEALTH_JSON = orjson.dumps(_HEALTH_STATUS)
 
 # Global VannaService instance
 vanna_service = None
 
+
+def setup_logging() -> QueueListener:
+    """Send log records through a queue so request handlers never block on stream writes"""
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    root_logger = logging.getLogger()
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(settings.log_level.upper())
+    # httpx logs every outgoing LLM/Qdrant request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
+
+class AccessLogMiddleware:
+    """Log one line per request through the logging queue instead of uvicorn's access log"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        status_code = 500
+        
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            client = scope.get("client")
+            access_logger.info(
+                '%s "%s %s" %d %.1fms',
+                client[0] if client else "-",
+                scope["method"],
+                scope["path"],
+                status_code,
+                (time.perf_counter() - start) * 1000
+            )
+
+async def sweep_idle_tenants(interval: float = 60):
+    """Periodically close tenant services that have not been used for a while"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = await anyio.to_thread.run_sync(service_manager.evict_idle)
+            if evicted:
+                logger.info("Closed idle tenant services: %s", ", ".join(evicted))
+        except Exception as e:
+            logger.warning("Error evicting idle tenant services: %s", e)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     global vanna_service
+    log_listener = setup_logging()
+    
+    # Blocking Vanna calls run in worker threads, allow more of them in flight
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 64
+    
     try:
-        print("Initializing vanna service...")
+        logger.info("Initializing vanna service...")
         vanna_service = VannaService()
-        print("Vanna service initialized successfully")
+        logger.info("Vanna service initialized successfully")
         
         # Set the default service in service manager
         service_manager._default_service = vanna_service
@@ -37,25 +126,30 @@ async def lifespan(app: FastAPI):
             from tenant_config import TENANT_CONFIGS
             for tenant_id, db_config in TENANT_CONFIGS.items():
                 service_manager.register_tenant(tenant_id, db_config)
-            print(f"Loaded {len(TENANT_CONFIGS)} tenant configurations")
+            logger.info("Loaded %d tenant configurations", len(TENANT_CONFIGS))
         except ImportError:
-            print("No tenant_config.py found, skipping tenant configuration loading")
+            logger.info("No tenant_config.py found, skipping tenant configuration loading")
         except Exception as e:
-            print(f"Error loading tenant configurations: {e}")
+            logger.error("Error loading tenant configurations: %s", e)
         
         # Include router after service is initialized
         app.include_router(get_text2sql_router(vanna_service))
-        print("Text2SQL router included successfully")
+        logger.info("Text2SQL router included successfully")
     except Exception as e:
-        print(f"Failed to initialize Vanna service: {str(e)}")
+        logger.error("Failed to initialize Vanna service: %s", e)
         vanna_service = None
     
+    idle_sweeper = asyncio.create_task(sweep_idle_tenants())
+    
     yield
     
     # Shutdown
-    print("Shutting down...")
+    logger.info("Shutting down...")
+    idle_sweeper.cancel()
     # Cleanup all cached services
     service_manager.cleanup_all()
+    close_llm_http_clients()
+    log_listener.stop()
 
 
 # Initialize FastAPI app
@@ -63,6 +157,7 @@ app = FastAPI(
     title="Text2SQL API with Vanna",
     description="A simple API to convert natural language to SQL using Vanna with ClickHouse",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -75,24 +170,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Access logging is off by default, it costs a formatted line per request
+if settings.access_log:
+    app.add_middleware(AccessLogMiddleware)
+
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """Answer unexpected errors with a 500 in the documented error response format"""
+    return ORJSONResponse(status_code=500, content={"sql": "", "error": str(exc)})
+
 
 @app.get("/")
 async def root():
-    return {
-        "message": "Text2SQL API with Vanna",
-        "version": "1.0.0",
-        "endpoints": {
-            "ask": "POST /ask - Ask a natural language question",
-            "sql": "POST /sql - Generate SQL only",
-            "execute": "POST /execute - Execute SQL directly",
-            "train": "POST /train - Train the model",
-            "health": "GET /health - Health check"
-        }
-    }
+    return Response(content=_ROOT_JSON, media_type="application/json", headers={"Cache-Control": "public, max-age=300"})
 
 
 @app.get("/health")
 async def health_check():
+    """Cheap liveness probe, does not touch tenant state"""
+    if vanna_service is None:
+        raise HTTPException(status_code=503, detail="Vanna service not initialized")
+    
+    return Response(content=_HEALTH_JSON, media_type="application/json")
+
+
+@app.get("/health/detailed")
+async def health_check_detailed():
+    """Health check including tenant service statistics"""
     if vanna_service is None:
         raise HTTPException(status_code=503, detail="Vanna service not initialized")
     
@@ -100,16 +205,27 @@ async def health_check():
     tenant_stats = service_manager.get_stats()
     
     return {
-        "status": "healthy",
-        "service": "vanna",
-        "database": "clickhouse",
-        "tenant_management": tenant_stats
+        **_HEALTH_STATUS,
+        "tenant_management": tenant_stats,
+        "caches": vanna_service.get_cache_stats()
     }
 
 if __name__ == "__main__":
     import uvicorn
     
-    host = os.getenv('API_HOST', '0.0.0.0')
-    port = int(os.getenv('API_PORT', 8000))
+    # Each worker is a separate process with its own VannaService, caches and
+    # tenant registry; runtime tenant and database config changes only reach the
+    # worker that served them, so more workers are opt-in with WEB_CONCURRENCY
+    workers = settings.web_concurrency or 1
     
-    uvicorn.run(app, host=host, port=port)
+    uvicorn.run(
+        "main:app",
+        host=settings.api_host,
+        port=settings.api_port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="info",
+        # Requests are logged by AccessLogMiddleware when ACCESS_LOG=1
+        access_log=False
+    )
@@ -3,7 +3,7 @@
 Example usage of the Text2SQL API
 """
 
-import requests
+import httpx
 import json
 import time
 
@@ -11,11 +11,36 @@ import time
 class Text2SQLClient:
     def __init__(self, base_url="http://localhost:8000"):
         self.base_url = base_url
+        # Keep-alive connection pool shared by every call made through this client
+        self._client = httpx.Client(
+            base_url=base_url,
+            timeout=httpx.Timeout(30.0),
+            # Retry failed connection attempts (e.g. while the API is starting up)
+            transport=httpx.HTTPTransport(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                retries=3
+            )
+        )
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """Close the underlying connection pool"""
+        self._client.close()
+    
+    def __del__(self):
+        client = getattr(self, "_client", None)
+        if client is not None:
+            client.close()
     
     def health_check(self):
         """Check if API is healthy"""
         try:
-            response = requests.get(f"{self.base_url}/health")
+            response = self._client.get("/health")
             return response.status_code == 200
         except:
             return False
@@ -26,7 +51,7 @@ class Text2SQLClient:
         if database_config:
             data["database_config"] = database_config
         
-        response = requests.post(f"{self.base_url}/ask", json=data)
+        response = self._client.post("/ask", json=data)
         return response.json()
     
     def generate_sql(self, question, database_config=None):
@@ -35,7 +60,7 @@ class Text2SQLClient:
         if database_config:
             data["database_config"] = database_config
         
-        response = requests.post(f"{self.base_url}/sql", json=data)
+        response = self._client.post("/sql", json=data)
         return response.json()
     
     def execute_sql(self, sql, database_config=None):
@@ -44,7 +69,7 @@ class Text2SQLClient:
         if database_config:
             data["database_config"] = database_config
         
-        response = requests.post(f"{self.base_url}/execute", json=data)
+        response = self._client.post("/execute", json=data)
         return response.json()
     
     def train_model(self, ddl=None, documentation=None, question=None, sql=None):
@@ -59,14 +84,18 @@ class Text2SQLClient:
         if sql:
             data["sql"] = sql
         
-        response = requests.post(f"{self.base_url}/train", json=data)
+        response = self._client.post("/train", json=data)
         return response.json()
 
 
 def example_usage():
     """Example usage of the API"""
-    client = Text2SQLClient()
-    
+    with Text2SQLClient() as client:
+        _run_examples(client)
+
+
+def _run_examples(client):
+    """Run the example calls against an open client"""
     # Check if API is running
     if not client.health_check():
         print("❌ API is not running. Please start it first with: ./start.sh")
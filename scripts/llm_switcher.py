@@ -6,205 +6,47 @@ Allows easy switching between different LLM providers
 
 import os
 import sys
-from typing import Dict, Any
 
-class LLMConfig:
-    """Configuration for different LLM providers"""
-    
-    PROVIDERS = {
-        'qwen': {
-            'class_name': 'CustomQwenLLM',
-            'required_vars': ['QWEN_API_KEY'],
-            'optional_vars': ['QWEN_BASE_URL', 'QWEN_MODEL'],
-            'defaults': {
-                'QWEN_BASE_URL': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
-                'QWEN_MODEL': 'qwen-turbo'
-            },
-            'description': 'Alibaba Qwen via DashScope API'
-        },
-        'openai': {
-            'class_name': 'CustomOpenAILLM',
-            'required_vars': ['OPENAI_API_KEY'],
-            'optional_vars': ['OPENAI_MODEL'],
-            'defaults': {
-                'OPENAI_MODEL': 'gpt-3.5-turbo'
-            },
-            'description': 'OpenAI GPT models'
-        },
-        'ollama': {
-            'class_name': 'CustomOllamaLLM',
-            'required_vars': [],
-            'optional_vars': ['OLLAMA_BASE_URL', 'OLLAMA_MODEL'],
-            'defaults': {
-                'OLLAMA_BASE_URL': 'http://localhost:11434/v1',
-                'OLLAMA_MODEL': 'qwen:14b'
-            },
-            'description': 'Local Ollama models'
-        }
-    }
+# Run from anywhere: the provider table lives in the application settings
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def generate_llm_class(provider: str) -> str:
-    """Generate LLM class code for specified provider"""
-    
-    if provider == 'qwen':
-        return '''class CustomQwenLLM(VannaBase):
-    """Custom LLM implementation using Qwen via OpenAI-compatible API"""
-    
-    def __init__(self, config=None):
-        VannaBase.__init__(self, config=config)
-        
-        try:
-            import openai
-            
-            qwen_api_key = os.getenv('QWEN_API_KEY') or os.getenv('DASHSCOPE_API_KEY')
-            qwen_base_url = os.getenv('QWEN_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
-            
-            if not qwen_api_key:
-                raise Exception("QWEN_API_KEY or DASHSCOPE_API_KEY environment variable is required")
-            
-            self.client = openai.OpenAI(
-                api_key=qwen_api_key,
-                base_url=qwen_base_url
-            )
-            
-            self.default_model = os.getenv('QWEN_MODEL', 'qwen-turbo')
-            
-        except ImportError:
-            raise Exception("OpenAI package not installed. Please install it with: pip install openai")
+from src.config import LLMConfig, Settings
 
-    def submit_prompt(self, prompt, **kwargs) -> str:
-        """Submit prompt to Qwen and return response"""
-        try:
-            model = kwargs.get('model', self.default_model)
-            
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that generates SQL queries. Always respond with valid SQL syntax."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=kwargs.get('max_tokens', 500),
-                temperature=kwargs.get('temperature', 0.1),
-                top_p=kwargs.get('top_p', 0.8)
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            raise Exception(f"Qwen API error: {str(e)}")
-    
-    def system_message(self, message: str) -> dict:
-        """Format system message for the chat API"""
-        return {"role": "system", "content": message}
-    
-    def user_message(self, message: str) -> dict:
-        """Format user message for the chat API"""
-        return {"role": "user", "content": message}
-    
-    def assistant_message(self, message: str) -> dict:
-        """Format assistant message for the chat API"""
-        return {"role": "assistant", "content": message}'''
-    
-    elif provider == 'openai':
-        return '''class CustomOpenAILLM(VannaBase):
-    """Custom LLM implementation using OpenAI"""
-    
-    def __init__(self, config=None):
-        VannaBase.__init__(self, config=config)
-        
-        try:
-            import openai
-            self.client = openai.OpenAI(
-                api_key=os.getenv('OPENAI_API_KEY')
-            )
-            self.default_model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
-        except ImportError:
-            raise Exception("OpenAI package not installed. Please install it with: pip install openai")
-        
-        if not os.getenv('OPENAI_API_KEY'):
-            raise Exception("OPENAI_API_KEY environment variable is required")
+ENV_FILE = '.env'
 
-    def submit_prompt(self, prompt, **kwargs) -> str:
-        """Submit prompt to OpenAI and return response"""
-        try:
-            model = kwargs.get('model', self.default_model)
-            
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that generates SQL queries. Always respond with valid SQL syntax."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=kwargs.get('max_tokens', 500),
-                temperature=kwargs.get('temperature', 0.1)
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
-    
-    def system_message(self, message: str) -> dict:
-        """Format system message for the chat API"""
-        return {"role": "system", "content": message}
-    
-    def user_message(self, message: str) -> dict:
-        """Format user message for the chat API"""
-        return {"role": "user", "content": message}
-    
-    def assistant_message(self, message: str) -> dict:
-        """Format assistant message for the chat API"""
-        return {"role": "assistant", "content": message}'''
-    
-    elif provider == 'ollama':
-        return '''class CustomOllamaLLM(VannaBase):
-    """Custom LLM implementation using Ollama"""
-    
-    def __init__(self, config=None):
-        VannaBase.__init__(self, config=config)
-        
-        try:
-            import openai
-            ollama_base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434/v1')
-            
-            self.client = openai.OpenAI(
-                api_key='dummy_key',  # Ollama doesn't require real API key
-                base_url=ollama_base_url
-            )
-            
-            self.default_model = os.getenv('OLLAMA_MODEL', 'qwen:14b')
-            
-        except ImportError:
-            raise Exception("OpenAI package not installed. Please install it with: pip install openai")
+def _settings_value(settings: Settings, var: str):
+    return getattr(settings, var.lower())
 
-    def submit_prompt(self, prompt, **kwargs) -> str:
-        """Submit prompt to Ollama and return response"""
-        try:
-            model = kwargs.get('model', self.default_model)
-            
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that generates SQL queries. Always respond with valid SQL syntax."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=kwargs.get('max_tokens', 500),
-                temperature=kwargs.get('temperature', 0.1)
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            raise Exception(f"Ollama API error: {str(e)}")
-    
-    def system_message(self, message: str) -> dict:
-        """Format system message for the chat API"""
-        return {"role": "system", "content": message}
+def _set_env_var(path: str, name: str, value: str):
+    """Set NAME=value in an env file, replacing an existing assignment or appending one"""
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+    
+    assignment = f"{name}={value}"
+    for i, line in enumerate(lines):
+        if line.split('=', 1)[0].strip() == name:
+            lines[i] = assignment
+            break
+    else:
+        lines.append(assignment)
     
-    def user_message(self, message: str) -> dict:
-        """Format user message for the chat API"""
-        return {"role": "user", "content": message}
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def show_provider_config(settings: Settings, provider: str):
+    """Print the variables a provider reads and their current values"""
+    config = LLMConfig.PROVIDERS[provider]
     
-    def assistant_message(self, message: str) -> dict:
-        """Format assistant message for the chat API"""
-        return {"role": "assistant", "content": message}'''
+    print(f"\n📋 Configuration Status:")
+    if config['api_key_vars']:
+        status = "✅" if any(_settings_value(settings, var) for var in config['api_key_vars']) else "❌"
+        print(f"   {status} {' or '.join(config['api_key_vars'])}")
     
-    else:
-        raise ValueError(f"Unknown provider: {provider}")
+    for var in (config['base_url_var'], config['model_var']):
+        default = Settings.model_fields[var.lower()].default
+        print(f"   📝 {var}={_settings_value(settings, var)} (default: {default})")
 
 def switch_llm_provider(provider: str):
     """Switch to specified LLM provider"""
@@ -215,103 +57,35 @@ def switch_llm_provider(provider: str):
         return False
     
     config = LLMConfig.PROVIDERS[provider]
+    settings = Settings()
     
-    # Check required environment variables
-    missing_vars = []
-    for var in config['required_vars']:
-        if not os.getenv(var):
-            missing_vars.append(var)
-    
-    if missing_vars:
-        print(f"❌ Missing required environment variables for {provider}: {', '.join(missing_vars)}")
+    # Check the API key is configured
+    if config['api_key_vars'] and not any(_settings_value(settings, var) for var in config['api_key_vars']):
+        print(f"❌ Missing required environment variables for {provider}: {' or '.join(config['api_key_vars'])}")
         return False
     
-    # Read current vanna_service.py
-    service_file = 'vanna_service.py'
-    if not os.path.exists(service_file):
-        print(f"❌ {service_file} not found")
-        return False
-    
-    with open(service_file, 'r') as f:
-        content = f.read()
-    
-    # Generate new LLM class
-    new_class = generate_llm_class(provider)
-    class_name = config['class_name']
-    
-    # Find and replace the LLM class
-    import re
-    
-    # Pattern to match any Custom*LLM class
-    pattern = r'class Custom\w+LLM\(VannaBase\):.*?(?=class|\Z)'
-    
-    # Replace the class
-    new_content = re.sub(pattern, new_class, content, flags=re.DOTALL)
-    
-    # Update the VannaQdrantClickHouse class to use the new LLM
-    pattern2 = r'class VannaQdrantClickHouse\(Qdrant_VectorStore, Custom\w+LLM\):'
-    new_content = re.sub(pattern2, f'class VannaQdrantClickHouse(Qdrant_VectorStore, {class_name}):', new_content)
-    
-    pattern3 = r'Custom\w+LLM\.__init__\(self, config=config\)'
-    new_content = re.sub(pattern3, f'{class_name}.__init__(self, config=config)', new_content)
-    
-    # Write back the file
-    with open(service_file, 'w') as f:
-        f.write(new_content)
+    # The service builds its LLM client for LLM_PROVIDER at startup, no code is rewritten
+    _set_env_var(ENV_FILE, 'LLM_PROVIDER', provider)
+    os.environ['LLM_PROVIDER'] = provider
     
     print(f"✅ Successfully switched to {provider} ({config['description']})")
-    print(f"   Class: {class_name}")
-    
-    # Show required configuration
-    print(f"\n📋 Required configuration:")
-    for var in config['required_vars']:
-        print(f"   {var}={os.getenv(var, 'NOT_SET')}")
-    
-    print(f"\n📋 Optional configuration:")
-    for var in config['optional_vars']:
-        default = config['defaults'].get(var, 'None')
-        current = os.getenv(var, default)
-        print(f"   {var}={current} (default: {default})")
+    print(f"   LLM_PROVIDER={provider} written to {ENV_FILE}")
+    show_provider_config(settings, provider)
     
     return True
 
 def show_current_provider():
     """Show currently configured provider"""
-    service_file = 'vanna_service.py'
-    if not os.path.exists(service_file):
-        print(f"❌ {service_file} not found")
-        return
+    settings = Settings()
+    provider = settings.llm_provider
     
-    with open(service_file, 'r') as f:
-        content = f.read()
+    if provider not in LLMConfig.PROVIDERS:
+        print(f"🔍 Current LLM Provider: {provider} (unknown provider)")
+        return
     
-    # Find current LLM class
-    import re
-    match = re.search(r'class (Custom\w+LLM)', content)
-    if match:
-        current_class = match.group(1)
-        
-        # Find which provider this belongs to
-        for provider, config in LLMConfig.PROVIDERS.items():
-            if config['class_name'] == current_class:
-                print(f"🔍 Current LLM Provider: {provider}")
-                print(f"   Description: {config['description']}")
-                print(f"   Class: {current_class}")
-                
-                # Show configuration status
-                print(f"\n📋 Configuration Status:")
-                for var in config['required_vars']:
-                    status = "✅" if os.getenv(var) else "❌"
-                    print(f"   {status} {var}")
-                
-                for var in config['optional_vars']:
-                    value = os.getenv(var, config['defaults'].get(var, 'Not set'))
-                    print(f"   📝 {var}={value}")
-                return
-        
-        print(f"🔍 Current LLM Class: {current_class} (unknown provider)")
-    else:
-        print("❌ No LLM class found in vanna_service.py")
+    print(f"🔍 Current LLM Provider: {provider}")
+    print(f"   Description: {LLMConfig.PROVIDERS[provider]['description']}")
+    show_provider_config(settings, provider)
 
 def main():
     """Main CLI function"""
@@ -339,8 +113,8 @@ def main():
         for provider, config in LLMConfig.PROVIDERS.items():
             print(f"\n{provider.upper()}:")
             print(f"  Description: {config['description']}")
-            print(f"  Required vars: {', '.join(config['required_vars']) or 'None'}")
-            print(f"  Optional vars: {', '.join(config['optional_vars']) or 'None'}")
+            print(f"  Required vars: {' or '.join(config['api_key_vars']) or 'None'}")
+            print(f"  Optional vars: {config['base_url_var']}, {config['model_var']}")
     
     elif command == 'switch':
         if len(sys.argv) < 3:
@@ -352,7 +126,7 @@ def main():
         if switch_llm_provider(provider):
             print(f"\n💡 Next steps:")
             print(f"   1. Restart your API server: python main.py")
-            print(f"   2. Test the new provider: python test_vanna_qdrant.py")
+            print(f"   2. Test the new provider: python tests/test_vanna_qdrant.py")
     
     else:
         print(f"❌ Unknown command: {command}")
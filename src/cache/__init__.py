@@ -0,0 +1,5 @@
+from .semantic_cache import SemanticCache
+from .single_flight import SingleFlight
+from .ttl_cache import TTLCache
+
+__all__ = ['SemanticCache', 'SingleFlight', 'TTLCache']
\ No newline at end of file
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Two-tier cache of generated SQL: exact question match, then, if a threshold is set,
+    embedding similarity. Entries expire after ttl seconds"""
+    
+    def __init__(self, embed_fn: Callable[[str], List[float]], threshold: Optional[float] = None, max_entries: int = 2048, ttl: float = 600):
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._exact: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._reset_similar()
+        # Bumped by clear(), SQL generated from an older version is not stored
+        self.version = 0
+    
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Normalize a question for exact-match lookups, case and runs of whitespace don't matter"""
+        return " ".join(question.lower().split())
+    
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        """Embed a question as a unit vector, or None if embedding is unavailable"""
+        try:
+            vector = np.asarray(self._embed_fn(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning("Semantic cache embedding error: %s", e)
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+    
+    def get_exact(self, question: str) -> Optional[str]:
+        """Return cached SQL for the exact (normalized) question"""
+        key = self.normalize(question)
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is None:
+                return None
+            expires_at, sql = entry
+            if expires_at < time.monotonic():
+                del self._exact[key]
+                return None
+            self._exact.move_to_end(key)
+            return sql
+    
+    def get_similar(self, embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Return cached SQL for the most similar question above the threshold"""
+        if embedding is None or self.threshold is None:
+            return None
+        with self._lock:
+            if not self._size:
+                return None
+            scores = self._embeddings[:self._size] @ embedding
+            # Expired and replaced rows never match
+            scores[self._expires[:self._size] < time.monotonic()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._sqls[best]
+            return None
+    
+    def set(self, question: str, sql: str, embedding: Optional[np.ndarray] = None, version: Optional[int] = None):
+        """Store generated SQL under the question and, if given, its embedding.
+        With version, SQL generated before the cache was last cleared is dropped."""
+        if self.ttl <= 0:
+            return
+        key = self.normalize(question)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._exact[key] = (expires_at, sql)
+            self._exact.move_to_end(key)
+            if len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+            
+            if embedding is not None and self.threshold is not None:
+                self._set_similar(key, sql, embedding, expires_at)
+    
+    def _reset_similar(self):
+        """Empty the similarity tier"""
+        # One embedding row per slot, allocated as needed up to max_entries. Slots are filled in
+        # order and, once all are used, reused oldest first like a ring buffer
+        self._embeddings: Optional[np.ndarray] = None
+        self._expires: Optional[np.ndarray] = None
+        self._sqls: List[Optional[str]] = []
+        self._keys: List[Optional[str]] = []
+        # Slot of each question's current row
+        self._slots: Dict[str, int] = {}
+        self._size = 0
+        self._next = 0
+    
+    def _set_similar(self, key: str, sql: str, embedding: np.ndarray, expires_at: float):
+        """Store the question's embedding row, replacing its previous one; the lock must be held"""
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            # Never matches again, the slot is reused when its turn comes
+            self._expires[slot] = -np.inf
+            self._keys[slot] = None
+        
+        if self._size < self.max_entries:
+            if self._embeddings is None or self._size == len(self._embeddings):
+                self._grow(embedding.shape[0])
+            slot = self._size
+            self._size += 1
+        else:
+            slot = self._next
+            self._next = (slot + 1) % self.max_entries
+            if self._keys[slot] is not None:
+                del self._slots[self._keys[slot]]
+        
+        self._embeddings[slot] = embedding
+        self._expires[slot] = expires_at
+        self._sqls[slot] = sql
+        self._keys[slot] = key
+        self._slots[key] = slot
+    
+    def _grow(self, dim: int):
+        """Double the slots, up to max_entries, so rows are copied O(1) times per insert on average"""
+        capacity = min(self.max_entries, max(16, 2 * self._size))
+        embeddings = np.zeros((capacity, dim), dtype=np.float32)
+        expires = np.full(capacity, -np.inf)
+        if self._embeddings is not None:
+            embeddings[:self._size] = self._embeddings[:self._size]
+            expires[:self._size] = self._expires[:self._size]
+        self._embeddings = embeddings
+        self._expires = expires
+        self._sqls.extend([None] * (capacity - len(self._sqls)))
+        self._keys.extend([None] * (capacity - len(self._keys)))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Entry counts, for monitoring"""
+        with self._lock:
+            similar = int(np.count_nonzero(self._expires[:self._size] >= time.monotonic())) if self._size else 0
+            return {"exact_entries": len(self._exact), "similar_entries": similar}
+    
+    def clear(self):
+        """Drop all cached entries, e.g. after training data changes"""
+        with self._lock:
+            self._exact.clear()
+            self._reset_similar()
+            self.version += 1
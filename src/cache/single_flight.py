@@ -0,0 +1,81 @@
+import threading
+from typing import Any, Callable, Dict, Generator, Hashable, Tuple
+
+
+class _Call:
+    """An in-flight call and, once done, its outcome"""
+    __slots__ = ('done', 'result', 'error', 'abandoned')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # The consumer of a do_iter call stopped iterating before it finished
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Runs one call per key at a time, concurrent callers with the same key share its outcome"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+    
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        """Wait for the call already running for key and return it, or register a new one to lead"""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    return call, True
+            
+            call.done.wait()
+            if not call.abandoned:
+                return call, False
+    
+    def _finish(self, key: Hashable, call: _Call):
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+    
+    @staticmethod
+    def _outcome(call: _Call) -> Any:
+        if call.error is not None:
+            raise call.error
+        return call.result
+    
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """Call fn(*args), or wait for the identical call already running and return its result"""
+        call, leader = self._join(key)
+        if not leader:
+            return self._outcome(call)
+        
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+    
+    def do_iter(self, key: Hashable, fn: Callable[..., Generator], *args) -> Generator[Any, None, Any]:
+        """Yield from the generator fn(*args) and return its return value, or wait for the identical
+        call already running and return its result without yielding anything"""
+        call, leader = self._join(key)
+        if not leader:
+            return self._outcome(call)
+        
+        try:
+            call.result = yield from fn(*args)
+            return call.result
+        except GeneratorExit:
+            # Nothing to share, a waiting caller runs the call itself
+            call.abandoned = True
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
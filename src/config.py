@@ -0,0 +1,100 @@
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Application settings, read once from the environment and .env file"""
+    model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True, extra="ignore", frozen=True)
+
+    # API
+    api_host: str = "0.0.0.0"
+    api_port: int = 8000
+    web_concurrency: Optional[int] = None
+    log_level: str = "INFO"
+    access_log: bool = False
+
+    # Tenants
+    max_active_tenants: int = 64
+    tenant_idle_ttl: int = 3600
+
+    # Text-to-SQL
+    database_type: str = "clickhouse"
+    # Cosine similarity at which a cached question's SQL is reused for a different question.
+    # Opt-in: questions differing only in a time window ("last week" vs "last month") can
+    # score above any useful threshold, so by default only the same question is a cache hit
+    semantic_cache_threshold: Optional[float] = None
+    # Seconds generated SQL is reused (0 disables). Training clears it only in the process that
+    # handled it, other workers and tenant services pick up new training data after this long
+    sql_cache_ttl: int = 600
+    prompt_cache_ttl: int = 3600
+    # Query results can go stale as data changes, so result caching is opt-in
+    result_cache_ttl: int = 0
+    # Each worker process caches the /training-data body, so training through another worker
+    # shows up here after at most this many seconds
+    training_data_cache_ttl: int = 10
+
+    # ClickHouse
+    clickhouse_host: str = "localhost"
+    clickhouse_port: int = 8123
+    clickhouse_user: str = "default"
+    clickhouse_password: str = ""
+    clickhouse_database: str = "default"
+
+    # Qdrant
+    qdrant_url: str = "http://localhost:6333"
+    qdrant_api_key: Optional[str] = None
+    # gRPC multiplexes requests over one HTTP/2 connection (port 6334)
+    qdrant_prefer_grpc: bool = True
+
+    # LLM provider used by CustomCompatibleLLM, one of LLMConfig.PROVIDERS
+    llm_provider: str = "qwen"
+
+    # Qwen
+    qwen_api_key: Optional[str] = None
+    dashscope_api_key: Optional[str] = None
+    qwen_base_url: str = "https://dashscope-intl.aliyuncs.com/compatible-mode/v1"
+    qwen_model: str = "qwen-turbo"
+
+    # OpenAI
+    openai_api_key: Optional[str] = None
+    openai_base_url: str = "https://api.openai.com/v1"
+    openai_model: str = "gpt-3.5-turbo"
+
+    # Ollama
+    ollama_base_url: str = "http://localhost:11434/v1"
+    ollama_model: str = "qwen:14b"
+
+
+class LLMConfig:
+    """OpenAI-compatible LLM providers, variables name the Settings fields they are read from"""
+
+    PROVIDERS = {
+        'qwen': {
+            'description': 'Alibaba Qwen via DashScope API',
+            'label': 'Qwen',
+            'api_key_vars': ['QWEN_API_KEY', 'DASHSCOPE_API_KEY'],
+            'base_url_var': 'QWEN_BASE_URL',
+            'model_var': 'QWEN_MODEL',
+            'extra_params': {'top_p': 0.8}
+        },
+        'openai': {
+            'description': 'OpenAI GPT models',
+            'label': 'OpenAI',
+            'api_key_vars': ['OPENAI_API_KEY'],
+            'base_url_var': 'OPENAI_BASE_URL',
+            'model_var': 'OPENAI_MODEL',
+            'extra_params': {}
+        },
+        'ollama': {
+            'description': 'Local Ollama models',
+            'label': 'Ollama',
+            # Ollama doesn't require a real API key
+            'api_key_vars': [],
+            'base_url_var': 'OLLAMA_BASE_URL',
+            'model_var': 'OLLAMA_MODEL',
+            'extra_params': {}
+        }
+    }
+
+
+settings = Settings()
@@ -1,4 +1,4 @@
-from .clickhouse_client import ClickHouseClient
+from .clickhouse_client import ClickHouseClient, ClickHouseQueryError
 from .schema_extractor import SchemaExtractor
 
-__all__ = ['ClickHouseClient', 'SchemaExtractor']
\ No newline at end of file
+__all__ = ['ClickHouseClient', 'ClickHouseQueryError', 'SchemaExtractor']
\ No newline at end of file
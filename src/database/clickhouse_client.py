@@ -1,76 +1,194 @@
-import os
+import logging
+import threading
 import pandas as pd
 import clickhouse_connect
-from typing import Dict, Any, Optional
+from clickhouse_connect.driver.exceptions import ClickHouseError
+from clickhouse_connect.driver.httputil import get_pool_manager
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+from src.config import Settings, settings as default_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClickHouseQueryError(Exception):
+    """A query sent to ClickHouse failed"""
+
+
+class _SharedClient:
+    """A clickhouse_connect client and the number of ClickHouseClients using it"""
+    __slots__ = ('client', 'users')
+    
+    def __init__(self, client):
+        self.client = client
+        self.users = 0
+
+
+# Clients by connection config, and the HTTP connections to each server shared by its clients.
+# Both are released when the last ClickHouseClient using them is closed
+_CLIENTS: Dict[Tuple[str, int, str, str, str], _SharedClient] = {}
+_POOL_MGRS: Dict[Tuple[str, int], Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _acquire_client(host: str, port: int, user: str, password: str, database: str):
+    """Get the shared clickhouse_connect client for a connection config, counting the caller as a user"""
+    key = (host, port, user, password, database)
+    with _CLIENTS_LOCK:
+        shared = _CLIENTS.get(key)
+        if shared is not None:
+            shared.users += 1
+            return shared.client
+        pool_mgr = _POOL_MGRS.get((host, port))
+        if pool_mgr is None:
+            pool_mgr = _POOL_MGRS[(host, port)] = get_pool_manager(maxsize=32, block=False)
+    
+    # Built outside the lock, get_client checks the server version.
+    # No session id, so one client can serve concurrent queries from several threads
+    client = clickhouse_connect.get_client(
+        host=host,
+        port=port,
+        username=user,
+        password=password,
+        database=database,
+        pool_mgr=pool_mgr,
+        autogenerate_session_id=False
+    )
+    
+    with _CLIENTS_LOCK:
+        # Another caller may have built one meanwhile, use that one
+        shared = _CLIENTS.setdefault(key, _SharedClient(client))
+        _POOL_MGRS.setdefault((host, port), pool_mgr)
+        shared.users += 1
+        return shared.client
+
+
+def _release_client(key: Tuple[str, int, str, str, str]):
+    """Count one user less for a shared client, dropping it and, if no other client talks to
+    its server, the server's pooled connections once nobody uses it"""
+    host, port = key[0], key[1]
+    with _CLIENTS_LOCK:
+        shared = _CLIENTS.get(key)
+        if shared is None:
+            return
+        shared.users -= 1
+        if shared.users > 0:
+            return
+        del _CLIENTS[key]
+        if any(other[:2] == (host, port) for other in _CLIENTS):
+            return
+        pool_mgr = _POOL_MGRS.pop((host, port), None)
+    
+    if pool_mgr is not None:
+        # Only idle connections are closed, a query still running finishes on its connection
+        pool_mgr.clear()
+
+
+# Columns of the configured database, in table and position order
+_SCHEMA_INFO_SQL = """
+SELECT
+    table_catalog,
+    table_schema,
+    table_name,
+    column_name,
+    data_type,
+    column_comment
+FROM information_schema.columns
+WHERE table_schema = {database:String}
+ORDER BY table_name, ordinal_position
+"""
 
 
 class ClickHouseClient:
     """ClickHouse database client with connection management"""
     
-    def __init__(self, database_config: Optional[Dict[str, Any]] = None):
+    def __init__(self, database_config: Optional[Dict[str, Any]] = None, settings: Optional[Settings] = None):
         if database_config:
             self.db_config = database_config
         else:
+            settings = settings or default_settings
             self.db_config = {
-                'host': os.getenv('CLICKHOUSE_HOST', 'localhost'),
-                'port': int(os.getenv('CLICKHOUSE_PORT', 8123)),
-                'user': os.getenv('CLICKHOUSE_USER', 'default'),
-                'password': os.getenv('CLICKHOUSE_PASSWORD', ''),
-                'database': os.getenv('CLICKHOUSE_DATABASE', 'default')
+                'host': settings.clickhouse_host,
+                'port': settings.clickhouse_port,
+                'user': settings.clickhouse_user,
+                'password': settings.clickhouse_password,
+                'database': settings.clickhouse_database
             }
         
         self.client = None
+        # Config key of the shared client this instance holds, released by close()
+        self._client_key = None
         self.connect()
     
+    @staticmethod
+    def _config_key(database_config: Dict[str, Any]) -> Tuple[str, int, str, str, str]:
+        """Key identifying the shared client for a database config"""
+        return (
+            database_config['host'],
+            int(database_config['port']),
+            database_config['user'],
+            database_config['password'],
+            database_config['database']
+        )
+    
     def connect(self):
-        """Connect to ClickHouse database"""
+        """Connect to ClickHouse database, reusing the shared client for this config"""
         try:
-            self.client = clickhouse_connect.get_client(
-                host=self.db_config['host'],
-                port=self.db_config['port'],
-                username=self.db_config['user'],
-                password=self.db_config['password'],
-                database=self.db_config['database']
-            )
-            
-            print(f"Connected to ClickHouse: {self.db_config['host']}:{self.db_config['port']}")
+            # get_client checks the server version, so a bad config still fails here
+            client_key = self._config_key(self.db_config)
+            self.client = _acquire_client(*client_key)
+            # Hold the new client before releasing the previous one, e.g. after update_config
+            previous_key, self._client_key = self._client_key, client_key
+            if previous_key is not None:
+                _release_client(previous_key)
             
-            # Test connection
-            test_result = self.client.query("SELECT 1 as test")
-            print(f"ClickHouse connection test successful")
+            logger.info("Connected to ClickHouse: %s:%s", self.db_config['host'], self.db_config['port'])
             
         except Exception as e:
-            print(f"Failed to connect to ClickHouse: {str(e)}")
+            logger.error("Failed to connect to ClickHouse: %s", e)
             raise
     
-    def run_sql(self, sql: str) -> pd.DataFrame:
-        """Execute SQL and return results as DataFrame"""
+    def run_sql(self, sql: str, parameters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Execute SQL and return results as DataFrame, parameters are bound by the server"""
         try:
-            result = self.client.query(sql)
-            # Convert to pandas DataFrame
-            df = pd.DataFrame(result.result_rows, columns=result.column_names)
-            return df
-        except Exception as e:
-            raise Exception(f"ClickHouse query error: {str(e)}")
+            # Built column by column from the native format, no per-row Python tuples
+            return self.client.query_df(sql, parameters=parameters)
+        except ClickHouseError as e:
+            raise ClickHouseQueryError(f"ClickHouse query error: {e}") from e
+    
+    def query(self, sql: str, column_oriented: bool = False) -> Tuple[List[str], Sequence[Sequence[Any]]]:
+        """Execute SQL and return column names with the rows, or one sequence per column when
+        column_oriented, as plain Python values without building a DataFrame"""
+        try:
+            result = self.client.query(sql, column_oriented=column_oriented)
+        except ClickHouseError as e:
+            raise ClickHouseQueryError(f"ClickHouse query error: {e}") from e
+        return list(result.column_names), result.result_set
+    
+    def iter_rows(self, sql: str) -> Iterator[Dict[str, Any]]:
+        """Execute SQL and yield result rows as dicts, one ClickHouse block at a time"""
+        with self.client.query_row_block_stream(sql) as stream:
+            column_names = stream.source.column_names
+            for block in stream:
+                for row in block:
+                    yield dict(zip(column_names, row))
+    
+    def close(self):
+        """Release the shared client, closed with its idle connections once no other service uses it.
+        A request still holding this instance can keep querying, on newly opened connections"""
+        client_key, self._client_key = self._client_key, None
+        if client_key is not None:
+            _release_client(client_key)
     
     def update_config(self, database_config: Dict[str, Any]):
-        """Update database configuration and reconnect"""
+        """Update database configuration and reconnect if it changed"""
+        unchanged = self.client is not None and self._config_key(database_config) == self._config_key(self.db_config)
         self.db_config = database_config
-        self.connect()
+        if not unchanged:
+            self.connect()
     
     def get_schema_info(self):
         """Get information schema from ClickHouse"""
-        schema_sql = """
-        SELECT 
-            table_name,
-            column_name,
-            data_type,
-            is_nullable,
-            column_default,
-            column_comment
-        FROM information_schema.columns 
-        WHERE table_schema = '{}'
-        ORDER BY table_name, ordinal_position
-        """.format(self.db_config['database'])
-        
-        return self.run_sql(schema_sql)
\ No newline at end of file
+        # Only the columns Vanna's generic training plan reads: catalog (database), schema,
+        # table, column name, data type and comment. The database is bound as a query parameter
+        return self.run_sql(_SCHEMA_INFO_SQL, parameters={'database': self.db_config['database']})
\ No newline at end of file
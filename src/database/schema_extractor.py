@@ -1,63 +1,111 @@
+import logging
 import re
-from typing import List, Set
+import threading
+import time
+from typing import FrozenSet, List, Optional, Set, Tuple
+from src.cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Column definitions and table names in CREATE TABLE statements (basic regex)
+_COLUMN_RE = re.compile(r'(\w+)\s+(?:UInt32|UInt64|String|DateTime|Int8|Int32|Int64|Bool|LowCardinality|Array)')
+_TABLE_RE = re.compile(r'CREATE TABLE\s+(?:IF NOT EXISTS\s+)?(\S+?)\s*\(', re.IGNORECASE)
+
+# Known (columns, tables) as found in the DDL, and the same names lowercased
+_SchemaEntry = Tuple[Tuple[List[str], List[str]], Tuple[FrozenSet[str], FrozenSet[str]]]
 
 
 class SchemaExtractor:
     """Utility class for extracting schema information from DDL training data"""
     
-    def __init__(self, vn_client):
+    def __init__(self, vn_client, cache_ttl: float = 300):
         self.vn = vn_client
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._cache: Optional[_SchemaEntry] = None
+        self._cache_ts = 0.0
+        # Bumped by invalidate(), a load started before it is not cached
+        self._version = 0
+        # Concurrent validations share one DDL scan when the cache is empty
+        self._loading = SingleFlight()
     
-    def get_known_columns_from_ddl(self) -> List[str]:
-        """Extract known column names from DDL training data"""
+    def invalidate(self):
+        """Drop the cached schema, e.g. after training data changes"""
+        with self._lock:
+            self._cache = None
+            self._version += 1
+    
+    def _get_ddl_contents(self) -> List[str]:
+        """Get the content of every DDL training record"""
+        training_data = self.vn.get_training_data()
+        if hasattr(training_data, 'loc'):
+            # Vanna returns a DataFrame, filter it with a boolean mask
+            if training_data.empty or 'training_data_type' not in training_data.columns:
+                return []
+            ddl_series = training_data.loc[training_data['training_data_type'] == 'ddl', 'content']
+            return ddl_series.fillna('').astype(str).tolist()
+        
+        training_records = training_data if isinstance(training_data, list) else []
+        return [
+            record.get('content', '')
+            for record in training_records
+            if record.get('training_data_type') == 'ddl'
+        ]
+    
+    def _load_schema(self) -> _SchemaEntry:
+        """Scan DDL training data for known columns and tables and cache the result"""
+        with self._lock:
+            version = self._version
+        
         try:
-            # Get DDL data from training
-            training_data = self.vn.get_training_data()
-            if hasattr(training_data, 'to_dict'):
-                training_records = training_data.to_dict('records')
-            else:
-                training_records = training_data if isinstance(training_data, list) else []
-            
-            columns = set()
-            for record in training_records:
-                if record.get('training_data_type') == 'ddl':
-                    ddl_content = record.get('content', '')
-                    # Extract column names from CREATE TABLE statements (basic regex)
-                    # Look for column definitions in CREATE TABLE
-                    column_matches = re.findall(
-                        r'(\w+)\s+(?:UInt32|UInt64|String|DateTime|Int8|Int32|Int64|Bool|LowCardinality|Array)', 
-                        ddl_content
-                    )
-                    columns.update(column_matches)
-            
-            return list(columns)
+            # One regex pass per pattern over all DDL statements
+            ddl_text = '\n'.join(self._get_ddl_contents())
+            columns = set(_COLUMN_RE.findall(ddl_text))
+            tables = set(_TABLE_RE.findall(ddl_text))
         except Exception as e:
-            print(f"Error extracting columns from DDL: {e}")
-            return []
+            logger.warning("Error extracting schema from DDL: %s", e)
+            return ([], []), (frozenset(), frozenset())
+        
+        # Lowercased table names also hold the bare name of schema-qualified tables, so a
+        # reference is recognized with one membership test whether it is qualified or not
+        tables_lower = set()
+        for table in tables:
+            table = table.lower().replace('`', '').replace('"', '')
+            tables_lower.add(table)
+            tables_lower.add(table.rsplit('.', 1)[-1])
+        entry = (
+            (list(columns), list(tables)),
+            (frozenset(column.lower() for column in columns), frozenset(tables_lower))
+        )
+        with self._lock:
+            if self._version == version:
+                self._cache = entry
+                self._cache_ts = time.monotonic()
+        return entry
+    
+    def _get_schema(self) -> _SchemaEntry:
+        """Cached schema entry, loaded at most cache_ttl seconds ago"""
+        with self._lock:
+            if self._cache is not None and time.monotonic() - self._cache_ts < self.cache_ttl:
+                return self._cache
+        return self._loading.do('schema', self._load_schema)
+    
+    def get_known_schema_from_ddl(self) -> Tuple[List[str], List[str]]:
+        """Extract known column and table names from DDL training data, cached for cache_ttl seconds"""
+        return self._get_schema()[0]
+    
+    def get_known_schema_lower(self) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+        """Known column and table names lowercased, for case-insensitive membership checks"""
+        return self._get_schema()[1]
+    
+    def get_known_columns_from_ddl(self) -> List[str]:
+        """Extract known column names from DDL training data"""
+        return self.get_known_schema_from_ddl()[0]
 
     def get_known_tables_from_ddl(self) -> List[str]:
         """Extract known table names from DDL training data"""
-        try:
-            # Get DDL data from training
-            training_data = self.vn.get_training_data()
-            if hasattr(training_data, 'to_dict'):
-                training_records = training_data.to_dict('records')
-            else:
-                training_records = training_data if isinstance(training_data, list) else []
-            
-            tables = set()
-            for record in training_records:
-                if record.get('training_data_type') == 'ddl':
-                    ddl_content = record.get('content', '')
-                    # Extract table names from CREATE TABLE statements
-                    table_matches = re.findall(r'CREATE TABLE\s+(\S+)\s*\(', ddl_content, re.IGNORECASE)
-                    tables.update(table_matches)
-            
-            return list(tables)
-        except Exception as e:
-            print(f"Error extracting tables from DDL: {e}")
-            return []
+        return self.get_known_schema_from_ddl()[1]
     
     def get_known_tables_set(self) -> Set[str]:
         """Get known tables as a set for faster lookups"""
-        return set([t.lower() for t in self.get_known_tables_from_ddl()])
\ No newline at end of file
+        return set(self.get_known_schema_lower()[1])
@@ -2,6 +2,8 @@
 Database-specific prompts for different SQL dialects
 """
 
+from types import MappingProxyType
+
 DATABASE_PROMPTS = {
     'clickhouse': {
         'system_prompt': """You are a ClickHouse SQL expert. Generate ONLY valid ClickHouse SQL queries. You MUST only use columns from the provided DDL. If you cannot answer, reply with 'Cannot answer.'
@@ -30,4 +32,13 @@ Return ONLY the SQL query.""",
         
         'table_context': ""
     }
-}
\ No newline at end of file
+}
+
+# Database types with a prompt, in definition order
+SUPPORTED_DATABASE_TYPES = tuple(DATABASE_PROMPTS)
+
+# System prompt with table context per database type, built once at import (read-only)
+FULL_SYSTEM_PROMPTS = MappingProxyType({
+    database_type: f"{config['system_prompt']}\n\n{config.get('table_context', '')}".strip()
+    for database_type, config in DATABASE_PROMPTS.items()
+})
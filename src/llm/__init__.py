@@ -1,5 +1,4 @@
-try:
-    from .qwen_client import VannaQdrantClickHouse
-    __all__ = ['VannaQdrantClickHouse']
-except ImportError:
-    __all__ = []
\ No newline at end of file
+from .qwen_client import QwenAPIError, VannaQdrantClickHouse
+from .custom_llm import CustomCompatibleLLM, LLMAPIError
+
+__all__ = ['CustomCompatibleLLM', 'LLMAPIError', 'QwenAPIError', 'VannaQdrantClickHouse']
\ No newline at end of file
@@ -0,0 +1,108 @@
+from functools import lru_cache
+from typing import List, Optional
+import httpx
+import openai
+from vanna.base import VannaBase
+from src.config import LLMConfig, settings as default_settings
+
+
+# Keep-alive pool for LLM API calls, so requests reuse existing TLS connections.
+# HTTP/2 is negotiated when the endpoint supports it, multiplexing concurrent calls on one connection.
+LLM_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+LLM_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+# Pooled clients opened by this process, closed together on shutdown
+_LLM_HTTP_CLIENTS: List[httpx.Client] = []
+
+
+@lru_cache(maxsize=None)
+def get_llm_http_client(base_url: str) -> httpx.Client:
+    """Get the HTTP client shared by every Vanna instance talking to base_url"""
+    client = httpx.Client(http2=True, limits=LLM_HTTP_LIMITS, timeout=LLM_HTTP_TIMEOUT)
+    _LLM_HTTP_CLIENTS.append(client)
+    return client
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str, base_url: str) -> openai.OpenAI:
+    """Get the OpenAI-compatible client shared by every Vanna instance using the same key and endpoint"""
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=LLM_HTTP_TIMEOUT,
+        http_client=get_llm_http_client(base_url)
+    )
+
+
+def close_llm_http_clients():
+    """Close the pooled LLM connections, clients created afterwards open new pools"""
+    for factory in (get_openai_client, get_llm_http_client):
+        factory.cache_clear()
+    while _LLM_HTTP_CLIENTS:
+        _LLM_HTTP_CLIENTS.pop().close()
+
+
+class LLMAPIError(Exception):
+    """The LLM provider's chat completion call failed"""
+
+
+class CustomCompatibleLLM(VannaBase):
+    """Custom LLM implementation for any OpenAI-compatible provider, picked with LLM_PROVIDER"""
+
+    def __init__(self, config=None):
+        VannaBase.__init__(self, config=config)
+
+        config = config or {}
+        self.settings = config.get('settings', default_settings)
+        self._init_llm_client(config.get('llm_provider'))
+
+    def _init_llm_client(self, provider_name: Optional[str] = None):
+        """Build the client of provider_name, by default settings.llm_provider; self.settings must be set"""
+        self.provider = provider_name or self.settings.llm_provider
+
+        if self.provider not in LLMConfig.PROVIDERS:
+            raise ValueError(f"Unknown LLM provider: {self.provider}")
+        provider = LLMConfig.PROVIDERS[self.provider]
+
+        api_key = next((key for key in (getattr(self.settings, var.lower()) for var in provider['api_key_vars']) if key), None)
+        if provider['api_key_vars'] and not api_key:
+            raise Exception(f"{' or '.join(provider['api_key_vars'])} environment variable is required")
+
+        base_url = getattr(self.settings, provider['base_url_var'].lower())
+        self.client = get_openai_client(api_key or 'dummy_key', base_url)
+
+        self.default_model = getattr(self.settings, provider['model_var'].lower())
+        self._label = provider['label']
+        self._extra_params = provider['extra_params']
+
+    def submit_prompt(self, prompt, **kwargs) -> str:
+        """Submit prompt to the configured provider and return response"""
+        model = kwargs.get('model', self.default_model)
+
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that generates SQL queries. Always respond with valid SQL syntax."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=kwargs.get('max_tokens', 500),
+                temperature=kwargs.get('temperature', 0.1),
+                **{name: kwargs.get(name, value) for name, value in self._extra_params.items()}
+            )
+        except openai.OpenAIError as e:
+            raise LLMAPIError(f"{self._label} API error: {e}") from e
+        return response.choices[0].message.content
+
+    def system_message(self, message: str) -> dict:
+        """Format system message for the chat API"""
+        return {"role": "system", "content": message}
+
+    def user_message(self, message: str) -> dict:
+        """Format user message for the chat API"""
+        return {"role": "user", "content": message}
+
+    def assistant_message(self, message: str) -> dict:
+        """Format assistant message for the chat API"""
+        return {"role": "assistant", "content": message}
@@ -1,117 +1,375 @@
-import os
-from typing import Dict, Any
+import hashlib
+import threading
+import weakref
+from types import MappingProxyType
+from functools import lru_cache
+from typing import Dict, Any, Generator, Iterator, List, Optional, Tuple
+import openai
 from vanna.qdrant import Qdrant_VectorStore
-from qdrant_client import QdrantClient
-from src.database_prompts import DATABASE_PROMPTS
+from vanna.types import TrainingPlan, TrainingPlanItem
+from vanna.utils import deterministic_uuid
+from qdrant_client import QdrantClient, models
+from src.cache import TTLCache
+from src.config import settings as default_settings
+from src.database_prompts import FULL_SYSTEM_PROMPTS
+from .custom_llm import CustomCompatibleLLM, LLMAPIError
 
 
-class VannaQdrantClickHouse(Qdrant_VectorStore):
-    """Custom Vanna implementation using Qdrant for vector storage and ClickHouse for database"""
+class QwenAPIError(LLMAPIError):
+    """The chat completion call of VannaQdrantClickHouse failed"""
+
+
+# Texts embedded per fastembed pass and stored per Qdrant upsert when training in bulk
+EMBEDDING_BATCH_SIZE = 256
+
+# Completions sampled above this temperature are meant to vary, so they are never cached
+PROMPT_CACHE_MAX_TEMPERATURE = 0.3
+
+# Seconds before a Qdrant request gives up, instead of hanging on an unresponsive server
+QDRANT_TIMEOUT = 30
+QDRANT_GRPC_OPTIONS = {'grpc.keepalive_time_ms': 30000}
+
+
+# Qdrant clients whose collections were already checked or created in this process
+_READY_COLLECTIONS: "weakref.WeakKeyDictionary[QdrantClient, set]" = weakref.WeakKeyDictionary()
+_READY_COLLECTIONS_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=16)
+def get_qdrant_client(url: str, api_key: Optional[str] = None, prefer_grpc: bool = True) -> QdrantClient:
+    """Get the Qdrant client shared by every Vanna instance using the same server and key"""
+    return QdrantClient(
+        url=url,
+        api_key=api_key,
+        prefer_grpc=prefer_grpc,
+        grpc_options=QDRANT_GRPC_OPTIONS if prefer_grpc else None,
+        timeout=QDRANT_TIMEOUT
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name: str):
+    """Load the fastembed model once per process and share it across all Vanna instances"""
+    from fastembed import TextEmbedding
+    return TextEmbedding(model_name=model_name)
+
+
+@lru_cache(maxsize=4096)
+def embed_text(model_name: str, text: str) -> Tuple[float, ...]:
+    """Embed one text, recent texts are reused since validation and every retrieval embed the same question"""
+    return tuple(next(get_embedding_model(model_name).embed(text)).tolist())
+
+
+class PromptCache(TTLCache):
+    """LRU cache of LLM completions keyed by a hash of the exact request, with a TTL"""
+    
+    @staticmethod
+    def key(messages: List[Dict[str, str]], **params) -> str:
+        """Hash the chat messages together with the completion parameters"""
+        payload = repr((messages, sorted(params.items()))).encode()
+        return hashlib.sha256(payload).hexdigest()
+    
+    def lookup(self, params: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """Cache key and cached completion for a request, (None, None) when it must not be cached"""
+        if params['temperature'] > PROMPT_CACHE_MAX_TEMPERATURE:
+            return None, None
+        key = self.key(**params)
+        return key, self.get(key)
+
+
+@lru_cache(maxsize=None)
+def get_prompt_cache(ttl: float) -> PromptCache:
+    """Get the completion cache shared by every Vanna instance, keys already cover model and full prompt"""
+    return PromptCache(ttl=ttl)
+
+
+# System message per database type, one shared object each so every request starts with the same prefix
+_SYSTEM_MESSAGES = MappingProxyType({
+    database_type: {"role": "system", "content": prompt}
+    for database_type, prompt in FULL_SYSTEM_PROMPTS.items()
+})
+
+
+def _has_user_content(messages: List[Dict[str, str]], min_length: int = 4) -> bool:
+    """Whether any non-system message has enough text to be worth sending to the LLM"""
+    return any(
+        message['role'] != 'system' and len(message['content'].strip()) >= min_length
+        for message in messages
+    )
+
+
+class VannaQdrantClickHouse(Qdrant_VectorStore, CustomCompatibleLLM):
+    """Custom Vanna implementation using Qdrant for vector storage and ClickHouse for database,
+    with the OpenAI-compatible LLM provider selected by LLM_PROVIDER"""
     
     def __init__(self, config=None):
         # Store database configuration
         self.database_type = config.get('database_type', 'clickhouse') if config else 'clickhouse'
+        if self.database_type not in _SYSTEM_MESSAGES:
+            raise ValueError(f"Unsupported database type: {self.database_type}")
+        self.settings = config.get('settings', default_settings) if config else default_settings
         
         # Initialize Qdrant vector store
         if config and 'qdrant_client' in config:
             qdrant_config = {'client': config['qdrant_client']}
         else:
             # Default Qdrant configuration
-            qdrant_url = os.getenv('QDRANT_URL', 'http://localhost:6333')
-            qdrant_api_key = os.getenv('QDRANT_API_KEY')
-            
-            if qdrant_api_key:
-                qdrant_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-            else:
-                qdrant_client = QdrantClient(url=qdrant_url)
-            
+            qdrant_client = get_qdrant_client(
+                self.settings.qdrant_url,
+                self.settings.qdrant_api_key,
+                self.settings.qdrant_prefer_grpc
+            )
             qdrant_config = {'client': qdrant_client}
         
         Qdrant_VectorStore.__init__(self, config=qdrant_config)
         
-        # Initialize Qwen client
-        self._init_qwen_client()
+        # LLM client of the configured provider, plus the completion cache in front of it
+        self._init_llm_client(config.get('llm_provider') if config else None)
+        # Retrieved context is part of the prompt, so new training data never hits stale entries.
+        # Shared across tenant services, which use the same collections and so the same prompts
+        self.prompt_cache = get_prompt_cache(self.settings.prompt_cache_ttl)
     
-    def _init_qwen_client(self):
-        """Initialize Qwen client"""
-        try:
-            import openai
-            
-            # Configure for Qwen API
-            qwen_api_key = os.getenv('QWEN_API_KEY') or os.getenv('DASHSCOPE_API_KEY')
-            qwen_base_url = os.getenv('QWEN_BASE_URL', 'https://dashscope-intl.aliyuncs.com/compatible-mode/v1')
-            
-            if not qwen_api_key:
-                raise Exception("QWEN_API_KEY or DASHSCOPE_API_KEY environment variable is required")
-            
-            self.qwen_client = openai.OpenAI(
-                api_key=qwen_api_key,
-                base_url=qwen_base_url
+    def _setup_collections(self):
+        """Check or create the collections once per shared Qdrant client, not once per tenant service"""
+        collections = (self.sql_collection_name, self.ddl_collection_name, self.documentation_collection_name)
+        with _READY_COLLECTIONS_LOCK:
+            ready = _READY_COLLECTIONS.setdefault(self._client, set())
+            if collections in ready:
+                return
+            Qdrant_VectorStore._setup_collections(self)
+            ready.add(collections)
+    
+    def remove_collection(self, collection_name: str) -> bool:
+        """Reset a collection to empty, recreating it even though the client was already set up"""
+        if collection_name not in self.id_suffixes:
+            return False
+        with _READY_COLLECTIONS_LOCK:
+            self._client.delete_collection(collection_name)
+            ready = _READY_COLLECTIONS.get(self._client, set())
+            ready.difference_update([collections for collections in ready if collection_name in collections])
+        self._setup_collections()
+        return True
+    
+    def generate_embedding(self, data: str, **kwargs) -> List[float]:
+        return list(embed_text(self.fastembed_model, data))
+    
+    def generate_embeddings(self, data: List[str]) -> List[List[float]]:
+        """Embed several strings in one batched pass of the embedding model"""
+        embedding_model = get_embedding_model(self.fastembed_model)
+        return [embedding.tolist() for embedding in embedding_model.embed(data)]
+    
+    def _upsert_batch(self, collection_name: str, texts: List[str], payloads: List[Dict[str, Any]], batch_size: int) -> List[str]:
+        """Embed and upsert texts in chunks of batch_size, one embedding pass and one upsert per chunk"""
+        ids = [deterministic_uuid(text) for text in texts]
+        
+        # Repeated texts map to the same point, embed and upsert each one only once (last payload wins)
+        unique = {id: (text, payload) for id, text, payload in zip(ids, texts, payloads)}
+        unique_ids = list(unique)
+        
+        for start in range(0, len(unique_ids), batch_size):
+            chunk_ids = unique_ids[start:start + batch_size]
+            embeddings = self.generate_embeddings([unique[id][0] for id in chunk_ids])
+            # Only the last upsert waits to be applied: Qdrant applies updates in order, so
+            # embedding the next chunk overlaps with indexing this one, and reads after
+            # training still see every point
+            self._client.upsert(
+                collection_name,
+                points=[
+                    models.PointStruct(id=id, vector=embedding, payload=unique[id][1])
+                    for id, embedding in zip(chunk_ids, embeddings)
+                ],
+                wait=start + batch_size >= len(unique_ids),
             )
+        
+        return [self._format_point_id(id, collection_name) for id in ids]
+    
+    def add_question_sql_batch(self, questions: List[str], sqls: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[str]:
+        """Store several question-SQL pairs with batched embeddings and upserts"""
+        question_answers = [
+            "Question: {0}\n\nSQL: {1}".format(question, sql)
+            for question, sql in zip(questions, sqls)
+        ]
+        payloads = [{"question": question, "sql": sql} for question, sql in zip(questions, sqls)]
+        return self._upsert_batch(self.sql_collection_name, question_answers, payloads, batch_size)
+    
+    def add_ddl_batch(self, ddls: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[str]:
+        """Store several DDL statements with batched embeddings and upserts"""
+        payloads = [{"ddl": ddl} for ddl in ddls]
+        return self._upsert_batch(self.ddl_collection_name, ddls, payloads, batch_size)
+    
+    def add_documentation_batch(self, docs: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[str]:
+        """Store several documentation strings with batched embeddings and upserts"""
+        payloads = [{"documentation": doc} for doc in docs]
+        return self._upsert_batch(self.documentation_collection_name, docs, payloads, batch_size)
+    
+    def count_training_data(self) -> int:
+        """Approximate number of training records, counted by Qdrant without fetching them"""
+        collections = (self.sql_collection_name, self.ddl_collection_name, self.documentation_collection_name)
+        return sum(self._client.count(collection, exact=False).count for collection in collections)
+    
+    def train_plan_batch(self, plan: TrainingPlan, batch_size: int = EMBEDDING_BATCH_SIZE):
+        """Train on a training plan like vn.train(plan=...), embedding each item type in batches"""
+        ddls, docs, questions, sqls = [], [], [], []
+        for item in plan._plan:
+            if item.item_type == TrainingPlanItem.ITEM_TYPE_DDL:
+                ddls.append(item.item_value)
+            elif item.item_type == TrainingPlanItem.ITEM_TYPE_IS:
+                docs.append(item.item_value)
+            elif item.item_type == TrainingPlanItem.ITEM_TYPE_SQL:
+                questions.append(item.item_name)
+                sqls.append(item.item_value)
+        
+        if ddls:
+            self.add_ddl_batch(ddls, batch_size)
+        if docs:
+            self.add_documentation_batch(docs, batch_size)
+        if questions:
+            self.add_question_sql_batch(questions, sqls, batch_size)
+    
+    def _build_messages(self, prompt) -> List[Dict[str, str]]:
+        """Build chat messages with the database-specific system prompt"""
+        # The system prompt always comes first and is the same object on every call, so the
+        # request starts with an identical prefix the provider can serve from its prompt cache.
+        # Looked up per call, so a changed database_type takes effect on the next prompt
+        system_message = _SYSTEM_MESSAGES[self.database_type]
+        
+        # Handle different prompt formats from Vanna
+        if isinstance(prompt, list):
+            messages = [system_message]
             
-            # Default Qwen model
-            self.qwen_model = os.getenv('QWEN_MODEL', 'qwen-turbo')
-            
-        except ImportError:
-            raise Exception("OpenAI package not installed. Please install it with: pip install openai")
-
-    def submit_prompt(self, prompt, **kwargs) -> str:
-        """Submit prompt to Qwen and return response"""
-        try:
-            model = kwargs.get('model', self.qwen_model)
-            
-            # Get database-specific system prompt
-            db_config = DATABASE_PROMPTS.get(self.database_type, DATABASE_PROMPTS['clickhouse'])
-            system_prompt = db_config['system_prompt']
-            table_context = db_config.get('table_context', '')
-            
-            # Build enhanced system prompt with table context
-            full_system_prompt = f"{system_prompt}\n\n{table_context}".strip()
-            
-            # Handle different prompt formats from Vanna
-            if isinstance(prompt, list):
-                messages = []
-                has_system = False
-                
-                for msg in prompt:
-                    if isinstance(msg, dict) and msg.get('role') == 'system':
-                        has_system = True
-                        # Replace system message with our enhanced one
-                        messages.append({"role": "system", "content": full_system_prompt})
-                    elif isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                        messages.append({
-                            "role": msg['role'],
-                            "content": str(msg['content'])
-                        })
+            for msg in prompt:
+                if not isinstance(msg, dict):
+                    messages.append({"role": "user", "content": str(msg)})
+                elif msg.get('role') == 'system':
+                    # Replaced by our enhanced one at the start
+                    continue
+                elif 'role' in msg and 'content' in msg:
+                    content = msg['content']
+                    if type(content) is str and len(msg) == 2:
+                        # Already well-formed, reuse it as is
+                        messages.append(msg)
                     else:
-                        messages.append({"role": "user", "content": str(msg)})
+                        messages.append({"role": msg['role'], "content": str(content)})
+                else:
+                    messages.append({"role": "user", "content": str(msg)})
                 
-                if not has_system:
-                    messages.insert(0, {"role": "system", "content": full_system_prompt})
-                    
-            elif isinstance(prompt, str):
-                messages = [
-                    {"role": "system", "content": full_system_prompt},
-                    {"role": "user", "content": prompt}
-                ]
-            else:
-                messages = [
-                    {"role": "system", "content": full_system_prompt},
-                    {"role": "user", "content": str(prompt)}
-                ]
-            
-            response = self.qwen_client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=kwargs.get('max_tokens', 500),
-                temperature=kwargs.get('temperature', 0.1)
-            )
-            
-            result = response.choices[0].message.content
-            return str(result) if result else ""
+        elif isinstance(prompt, str):
+            messages = [system_message, {"role": "user", "content": prompt}]
+        else:
+            messages = [system_message, {"role": "user", "content": str(prompt)}]
+        
+        return messages
+    
+    def _completion_params(self, prompt, **kwargs) -> Dict[str, Any]:
+        """Build the chat completion request for a prompt"""
+        return {
+            'model': kwargs.get('model', self.default_model),
+            'messages': self._build_messages(prompt),
+            'max_tokens': kwargs.get('max_tokens', 500),
+            'temperature': kwargs.get('temperature', 0.1),
+            **{name: kwargs.get(name, value) for name, value in self._extra_params.items()}
+        }
+    
+    def submit_prompt(self, prompt, **kwargs) -> str:
+        """Submit prompt to the LLM and return response, reusing the completion of an identical prompt"""
+        params = self._completion_params(prompt, **kwargs)
+        # Nothing to answer, skip the API call
+        if not _has_user_content(params['messages']):
+            return ""
+        
+        cache_key, cached = self.prompt_cache.lookup(params)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = self.client.chat.completions.create(**params)
+        except openai.OpenAIError as e:
+            raise QwenAPIError(f"{self._label} API error: {e}") from e
+        
+        result = response.choices[0].message.content
+        if not result:
+            return ""
+        result = str(result)
+        if cache_key:
+            self.prompt_cache.set(cache_key, result)
+        return result
+    
+    def submit_prompt_streaming(self, prompt, **kwargs) -> Iterator[str]:
+        """Submit prompt to the LLM and yield the response text as it is generated"""
+        params = self._completion_params(prompt, **kwargs)
+        # Nothing to answer, skip the API call
+        if not _has_user_content(params['messages']):
+            return
+        
+        cache_key, cached = self.prompt_cache.lookup(params)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        try:
+            for chunk in self.client.chat.completions.create(stream=True, **params):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except openai.OpenAIError as e:
+            raise QwenAPIError(f"{self._label} API error: {e}") from e
+        
+        result = "".join(parts)
+        if result and cache_key:
+            self.prompt_cache.set(cache_key, result)
+    
+    def _stream_completion(self, prompt, **kwargs) -> Generator[Tuple[str, str], None, str]:
+        """Yield ("token", text) while the LLM writes and return the whole response"""
+        parts = []
+        for delta in self.submit_prompt_streaming(prompt, **kwargs):
+            parts.append(delta)
+            yield "token", delta
+        return "".join(parts)
+    
+    def generate_sql_stream(self, question: str, allow_llm_to_see_data: bool = False, **kwargs) -> Generator[Tuple[str, str], None, str]:
+        """Like generate_sql, but yields ("token", text) while the LLM writes and returns the SQL.
+        If the LLM asks to look at the data first, ("intermediate_sql", sql) is yielded after its
+        tokens and the tokens that follow are the final answer's"""
+        initial_prompt = self.config.get("initial_prompt", None) if self.config is not None else None
+        question_sql_list = self.get_similar_question_sql(question, **kwargs)
+        ddl_list = self.get_related_ddl(question, **kwargs)
+        doc_list = self.get_related_documentation(question, **kwargs)
+        prompt = self.get_sql_prompt(
+            initial_prompt=initial_prompt,
+            question=question,
+            question_sql_list=question_sql_list,
+            ddl_list=ddl_list,
+            doc_list=doc_list,
+            **kwargs,
+        )
+        llm_response = yield from self._stream_completion(prompt, **kwargs)
+        
+        if 'intermediate_sql' in llm_response:
+            if not allow_llm_to_see_data:
+                return "The LLM is not allowed to see the data in your database. Your question requires database introspection to generate the necessary SQL. Please set allow_llm_to_see_data=True to enable this."
             
-        except Exception as e:
-            raise Exception(f"Qwen API error: {str(e)}")
+            # The streamed response is the intermediate query, its results go into a second prompt
+            intermediate_sql = self.extract_sql(llm_response)
+            yield "intermediate_sql", intermediate_sql
+            try:
+                df = self.run_sql(intermediate_sql)
+                prompt = self.get_sql_prompt(
+                    initial_prompt=initial_prompt,
+                    question=question,
+                    question_sql_list=question_sql_list,
+                    ddl_list=ddl_list,
+                    doc_list=doc_list + [f"The following is a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}: \n" + df.to_markdown()],
+                    **kwargs,
+                )
+                llm_response = yield from self._stream_completion(prompt, **kwargs)
+            except Exception as e:
+                return f"Error running intermediate SQL: {e}"
+        
+        return self.extract_sql(llm_response)
     
     def system_message(self, message: str) -> Dict[str, str]:
         """Format system message for the chat API"""
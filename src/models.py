@@ -1,8 +1,10 @@
-from typing import Optional, Dict, Any, List
-from pydantic import BaseModel
+from typing import Optional, Any, Dict, List, Union
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class DatabaseConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     host: str
     port: int
     user: str
@@ -11,18 +13,39 @@ class DatabaseConfig(BaseModel):
 
 
 class QueryRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     question: str
     tenant_id: Optional[str] = None
     database_config: Optional[DatabaseConfig] = None
 
 
+class BatchQueryRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
+    questions: List[str] = Field(..., min_length=1)
+    tenant_id: Optional[str] = None
+    database_config: Optional[DatabaseConfig] = None
+
+
+class ExecuteRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
+    sql: str = Field(..., min_length=1)
+    database_config: Optional[DatabaseConfig] = None
+
+
 class QueryResponse(BaseModel):
     sql: str
-    results: Optional[List[Dict[str, Any]]] = None
+    # Rows come straight from the DataFrame, validating each one adds nothing.
+    # With ?layout=columns this is a mapping of column name to values
+    results: Optional[Union[List[Any], Dict[str, List[Any]]]] = None
     error: Optional[str] = None
 
 
 class TrainingRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     ddl: Optional[str] = None
     documentation: Optional[str] = None
     sql: Optional[List[str]] = None
@@ -1,62 +1,99 @@
 
-import os
-from fastapi import APIRouter, HTTPException
-import sys
+import asyncio
+import itertools
+from decimal import Decimal
+import logging
+from typing import Literal
+import anyio
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 
-from src.models import DatabaseConfig, QueryRequest, QueryResponse, TrainingRequest
+from src.models import BatchQueryRequest, DatabaseConfig, ExecuteRequest, QueryRequest, QueryResponse, TrainingRequest
 from src.service_manager import service_manager
 
-sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+logger = logging.getLogger(__name__)
+
+# Questions of one /sql/batch or /ask/batch request handled at the same time
+BATCH_MAX_CONCURRENT = 10
 
 router = APIRouter(
     tags=["text2sql"]
 )
 
+def _json_default(value):
+    """orjson fallback for values found in query results, e.g. Decimal columns"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _json_response(content) -> Response:
+    """Encode a response body in one orjson pass, without pydantic validation or jsonable_encoder"""
+    return Response(
+        content=orjson.dumps(content, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS),
+        media_type="application/json"
+    )
+
+
+def _ndjson_lines(rows):
+    """Encode result rows as newline-delimited JSON"""
+    for row in rows:
+        yield orjson.dumps(row, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+
+def _ask_body(result) -> dict:
+    """Response body for the result of VannaService.ask, in the shape of QueryResponse"""
+    # Handle the case where no SQL could be generated for the question
+    if 'error' in result:
+        return {"sql": result.get('sql', ''), "results": None, "error": result['error']}
+    
+    # Rows as dictionaries, or columns with ?layout=columns
+    results_data = result.get('results')
+    results_list = results_data['data'] if results_data and 'data' in results_data else None
+    return {"sql": result.get('sql', ''), "results": results_list, "error": None}
+
+
+def _sse_events(events):
+    """Encode (event, text) pairs as server-sent events, and ("results", rows) as {"results": rows}"""
+    try:
+        for event, text in events:
+            data = {"results": text} if event == "results" else {"text": text}
+            yield b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+    except Exception as e:
+        yield b"event: error\ndata: " + orjson.dumps({"text": str(e)}) + b"\n\n"
+
+
 def get_text2sql_router(vanna_service):
+    async def _service_for_config(config: DatabaseConfig):
+        """Get the cached service for an ad-hoc database config"""
+        db_config = config.model_dump()
+        return await anyio.to_thread.run_sync(service_manager.get_or_create, db_config)
+    
+    async def _select_service(request: QueryRequest | BatchQueryRequest):
+        """Pick the service for a request: tenant, ad-hoc database config, or default"""
+        if request.tenant_id:
+            return await anyio.to_thread.run_sync(service_manager.get_service, request.tenant_id)
+        if request.database_config:
+            return await _service_for_config(request.database_config)
+        return vanna_service
+    
     @router.post("/ask", response_model=QueryResponse)
-    async def ask_question(request: QueryRequest):
-        """Ask a natural language question and get both SQL and results"""
+    async def ask_question(request: QueryRequest, layout: Literal['records', 'columns'] = 'records'):
+        """Ask a natural language question and get both SQL and results.
+        With ?layout=columns results are one list of values per column instead of row objects."""
         if vanna_service is None:
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
-        try:
-            # Use tenant-based service selection
-            if request.tenant_id:
-                service = service_manager.get_service(request.tenant_id)
-                result = service.ask(request.question)
-            else:
-                result = vanna_service.ask(request.question)
-                
-            print("DEBUG: Ask question result:")   
-            print(result)
-            
-            # Handle error case
-            if 'error' in result:
-                return QueryResponse(
-                    sql=result.get('sql', ''),
-                    error=result['error'],
-                    results=None
-                )
+        # Failures propagate to the app's exception handler, which answers 500 with the error body
+        # Use tenant-based service selection
+        service = await _select_service(request)
+        result = await anyio.to_thread.run_sync(service.ask, request.question, layout)
             
-            # Handle success case
-            results_data = result.get('results')
-            if results_data and 'data' in results_data:
-                # Convert the results format to list of dictionaries
-                results_list = results_data['data']
-            else:
-                results_list = None
-                
-            return QueryResponse(
-                sql=result.get('sql', ''),
-                results=results_list
-            )
+        logger.debug("Ask question result: %s", result)
         
-        except Exception as e:
-            return QueryResponse(
-                sql="",
-                error=str(e),
-                results=None
-            )
+        # Encoded directly, QueryResponse only documents the shape
+        return _json_response(_ask_body(result))
 
 
     @router.post("/sql")
@@ -67,11 +104,8 @@ def get_text2sql_router(vanna_service):
         
         try:
             # Use tenant-based service selection
-            if request.tenant_id:
-                service = service_manager.get_service(request.tenant_id)
-                sql = service.generate_sql(request.question)
-            else:
-                sql = vanna_service.generate_sql(request.question)
+            service = await _select_service(request)
+            sql = await anyio.to_thread.run_sync(service.generate_sql, request.question)
             
             return {"sql": sql}
         
@@ -79,24 +113,117 @@ def get_text2sql_router(vanna_service):
             raise HTTPException(status_code=500, detail=str(e))
 
 
-    @router.post("/execute")
-    async def execute_sql(sql_request: dict):
-        """Execute SQL directly"""
+    @router.post("/sql/stream")
+    async def generate_sql_stream(request: QueryRequest):
+        """Generate SQL as server-sent events: "token" events while the LLM writes, then one "sql" event.
+        An "intermediate_sql" event means the tokens so far were a query to look at the data first"""
         if vanna_service is None:
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
-        sql = sql_request.get('sql')
-        if not sql:
-            raise HTTPException(status_code=400, detail="SQL query is required")
+        try:
+            service = await _select_service(request)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        return StreamingResponse(
+            _sse_events(service.generate_sql_stream(request.question)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"}
+        )
+
+
+    @router.post("/ask/stream")
+    async def ask_question_stream(request: QueryRequest, layout: Literal['records', 'columns'] = 'records'):
+        """Ask a question as server-sent events: the events of /sql/stream, then one "results" event,
+        or an "error" event if no SQL could be generated or it failed to run"""
+        if vanna_service is None:
+            raise HTTPException(status_code=503, detail="Vanna service not initialized")
+        
+        service = await _select_service(request)
+        
+        return StreamingResponse(
+            _sse_events(service.ask_stream(request.question, layout)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"}
+        )
+
+
+    @router.post("/sql/batch")
+    async def generate_sql_batch(request: BatchQueryRequest):
+        """Generate SQL for several questions concurrently"""
+        if vanna_service is None:
+            raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
         try:
-            # Update database config if provided
-            if 'database_config' in sql_request:
-                db_config = sql_request['database_config']
-                temp_service = service_manager.get_service(db_config)
-                results = temp_service.run_sql(sql)
+            service = await _select_service(request)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        # LLM round trips dominate, so overlap them with a bounded number of threads
+        limiter = anyio.CapacityLimiter(BATCH_MAX_CONCURRENT)
+        sqls = await asyncio.gather(
+            *[anyio.to_thread.run_sync(service.generate_sql, question, limiter=limiter) for question in request.questions],
+            return_exceptions=True
+        )
+        
+        results = []
+        for question, sql in zip(request.questions, sqls):
+            if isinstance(sql, Exception):
+                results.append({"question": question, "sql": "", "error": str(sql)})
             else:
-                results = vanna_service.run_sql(sql)
+                results.append({"question": question, "sql": sql})
+        
+        return {"results": results}
+
+
+    @router.post("/ask/batch")
+    async def ask_batch(request: BatchQueryRequest, layout: Literal['records', 'columns'] = 'records'):
+        """Generate and run SQL for several questions concurrently"""
+        if vanna_service is None:
+            raise HTTPException(status_code=503, detail="Vanna service not initialized")
+        
+        service = await _select_service(request)
+        
+        # Each question is an LLM round trip followed by a query, overlap them like /sql/batch
+        limiter = anyio.CapacityLimiter(BATCH_MAX_CONCURRENT)
+        answers = await asyncio.gather(
+            *[anyio.to_thread.run_sync(service.ask, question, layout, limiter=limiter) for question in request.questions],
+            return_exceptions=True
+        )
+        
+        results = []
+        for question, answer in zip(request.questions, answers):
+            if isinstance(answer, Exception):
+                results.append({"question": question, "sql": "", "results": None, "error": str(answer)})
+            else:
+                results.append({"question": question, **_ask_body(answer)})
+        
+        return _json_response({"results": results})
+
+
+    @router.post("/execute")
+    async def execute_sql(request: ExecuteRequest, stream: bool = False, layout: Literal['records', 'columns'] = 'records'):
+        """Execute SQL directly. With ?stream=true rows are sent as NDJSON while they are read,
+        with ?layout=columns data is one list of values per column instead of row objects."""
+        if vanna_service is None:
+            raise HTTPException(status_code=503, detail="Vanna service not initialized")
+        
+        try:
+            # Use the database config if provided
+            if request.database_config:
+                service = await _service_for_config(request.database_config)
+            else:
+                service = vanna_service
+            
+            if stream:
+                rows = service.run_sql_iter(request.sql)
+                # Read the first row up front so query errors still surface as a 500
+                first_row = await anyio.to_thread.run_sync(next, rows, None)
+                if first_row is not None:
+                    rows = itertools.chain([first_row], rows)
+                return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson")
+            
+            results = await anyio.to_thread.run_sync(service.run_sql, request.sql, layout)
             
             return {"results": results}
         
@@ -110,37 +237,38 @@ def get_text2sql_router(vanna_service):
         if vanna_service is None:
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
+        if not (request.ddl or request.documentation or (request.question and request.sql)):
+            raise HTTPException(status_code=400, detail="At least one training data type is required")
+        
+        # Ensure both arrays have the same length before any training starts
+        if request.question and request.sql and len(request.question) != len(request.sql):
+            raise HTTPException(status_code=400, detail="Question and SQL arrays must have the same length")
+        
         try:
-            results = []
-            
+            # Each training type writes to its own collection, so they run concurrently
+            tasks = []
             if request.ddl:
-                result = vanna_service.train_ddl(request.ddl)
-                results.append({"type": "ddl", "result": result})
+                tasks.append(anyio.to_thread.run_sync(vanna_service.train_ddl, request.ddl))
+            if request.documentation:
+                tasks.append(anyio.to_thread.run_sync(vanna_service.train_documentation, request.documentation))
+            if request.question and request.sql:
+                # Embed and store all pairs in one batch
+                tasks.append(anyio.to_thread.run_sync(vanna_service.train_sql_batch, request.question, request.sql))
+            
+            done = iter(await asyncio.gather(*tasks))
             
+            results = []
+            if request.ddl:
+                results.append({"type": "ddl", "result": next(done)})
             if request.documentation:
-                result = vanna_service.train_documentation(request.documentation)
-                results.append({"type": "documentation", "result": result})
-
-            # Loop through question-SQL pairs
+                results.append({"type": "documentation", "result": next(done)})
             if request.question and request.sql:
-                # Ensure both arrays have the same length
-                if len(request.question) != len(request.sql):
-                    raise HTTPException(status_code=400, detail="Question and SQL arrays must have the same length")
-                
-                # Loop through each pair
-                for i, (question, sql) in enumerate(zip(request.question, request.sql)):
-                    result = vanna_service.train_sql(question, sql)
+                for i, result in enumerate(next(done)):
                     results.append({"type": "question_sql", "pair": i+1, "result": result})
-            
-            if not results:
-                raise HTTPException(status_code=400, detail="At least one training data type is required")
-
-            try:
-                current_data = vanna_service.get_training_data()
-                print(f"DEBUG: After training, we have {len(current_data)} training records")
-            except Exception as e:
-                print(f"DEBUG: Error checking training data after insert: {e}")
-        
+
+            if logger.isEnabledFor(logging.DEBUG):
+                total = await anyio.to_thread.run_sync(vanna_service.get_training_data_count)
+                logger.debug("Trained %d new records, %d training records in total", len(results), total)
             
             return {"training_results": results}
         
@@ -155,24 +283,34 @@ def get_text2sql_router(vanna_service):
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
         try:
-            result = vanna_service.train_from_information_schema()
+            result = await anyio.to_thread.run_sync(vanna_service.train_from_information_schema)
             return result
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
 
     @router.get("/training-data")
-    async def get_training_data():
-        """Get current training data"""
+    async def get_training_data(request: Request, stream: bool = False):
+        """Get current training data, answering 304 when the client's ETag is current.
+        With ?stream=true records are sent as NDJSON while they are converted."""
         if vanna_service is None:
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
         try:
-            data = vanna_service.get_training_data()
-            print(f"DEBUG: Found {len(data)} training records")
-            return {"training_data": data}
+            if stream:
+                records = vanna_service.iter_training_data()
+                # Fetch and convert the first chunk up front so errors still surface as a 500
+                first_record = await anyio.to_thread.run_sync(next, records, None)
+                if first_record is not None:
+                    records = itertools.chain([first_record], records)
+                return StreamingResponse(_ndjson_lines(records), media_type="application/x-ndjson")
+            
+            etag, body = await anyio.to_thread.run_sync(vanna_service.get_training_data_payload)
+            if request.headers.get("If-None-Match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            return Response(content=body, media_type="application/json", headers={"ETag": etag})
         except Exception as e:
-            print(f"DEBUG: Error getting training data: {e}")
+            logger.error("Error getting training data: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -183,7 +321,7 @@ def get_text2sql_router(vanna_service):
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
         try:
-            result = vanna_service.remove_training_data(data_id)
+            result = await anyio.to_thread.run_sync(vanna_service.remove_training_data, data_id)
             return result
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -195,7 +333,7 @@ def get_text2sql_router(vanna_service):
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
         try:
-            result = vanna_service.add_documentation(documentation)
+            result = await anyio.to_thread.run_sync(vanna_service.train_documentation, documentation)
             return result
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -208,14 +346,8 @@ def get_text2sql_router(vanna_service):
             raise HTTPException(status_code=503, detail="Vanna service not initialized")
         
         try:
-            db_config = {
-                'host': config.host,
-                'port': config.port,
-                'user': config.user,
-                'password': config.password,
-                'database': config.database
-            }
-            result = vanna_service.update_config(db_config)
+            db_config = config.model_dump()
+            result = await anyio.to_thread.run_sync(vanna_service.update_config, db_config)
             return result
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -224,13 +356,7 @@ def get_text2sql_router(vanna_service):
     async def register_tenant(tenant_id: str, config: DatabaseConfig):
         """Register a new tenant with their database configuration"""
         try:
-            db_config = {
-                'host': config.host,
-                'port': config.port,
-                'user': config.user,
-                'password': config.password,
-                'database': config.database
-            }
+            db_config = config.model_dump()
             service_manager.register_tenant(tenant_id, db_config)
             return {"message": f"Tenant {tenant_id} registered successfully"}
         except Exception as e:
@@ -240,7 +366,8 @@ def get_text2sql_router(vanna_service):
     async def remove_tenant(tenant_id: str):
         """Remove a tenant and cleanup their service"""
         try:
-            service_manager.remove_tenant(tenant_id)
+            # Closing the tenant's service may block on its connections
+            await anyio.to_thread.run_sync(service_manager.remove_tenant, tenant_id)
             return {"message": f"Tenant {tenant_id} removed successfully"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
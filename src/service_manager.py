@@ -2,22 +2,50 @@
 Simple tenant-based service manager for mapping database connections by tenant_id.
 """
 
-from typing import Dict, Optional
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from src.cache import SingleFlight
+from src.config import settings
 from src.vanna_service import VannaService
 
+logger = logging.getLogger(__name__)
+
 
 class ServiceManager:
     """Manages VannaService instances mapped by tenant_id."""
     
-    def __init__(self, default_service: Optional[VannaService] = None):
-        self._tenant_services: Dict[str, VannaService] = {}
+    def __init__(
+        self,
+        default_service: Optional[VannaService] = None,
+        max_config_services: int = 64,
+        max_tenant_services: int = 64,
+        tenant_idle_ttl: float = 3600
+    ):
+        # Tenant services, least recently used first, with the time each was last used
+        self._tenant_services: "OrderedDict[str, VannaService]" = OrderedDict()
+        self._tenant_last_used: Dict[str, float] = {}
+        self._tenant_services_lock = threading.Lock()
+        self.max_tenant_services = max_tenant_services
+        self.tenant_idle_ttl = tenant_idle_ttl
         self._tenant_configs: Dict[str, dict] = {}  # Store tenant configurations
         self._default_service = default_service
+        # Services for ad-hoc database configs sent with a request, least recently used first
+        self._config_services: "OrderedDict[Tuple, VannaService]" = OrderedDict()
+        self._config_lock = threading.Lock()
+        # Services for a config are built outside _config_lock, once however many requests race for it
+        self._config_inflight = SingleFlight()
+        # One lock per tenant, so a tenant's service is only built once however many requests race for it
+        self._tenant_locks: Dict[str, threading.Lock] = {}
+        self._tenant_locks_lock = threading.Lock()
+        self.max_config_services = max_config_services
     
     def register_tenant(self, tenant_id: str, db_config: dict):
         """Register a tenant with their database configuration."""
         self._tenant_configs[tenant_id] = db_config
-        print(f"Registered tenant: {tenant_id}")
+        logger.info("Registered tenant: %s", tenant_id)
     
     def get_service(self, tenant_id: Optional[str] = None) -> VannaService:
         """
@@ -35,17 +63,117 @@ class ServiceManager:
             return self._default_service
         
         # Check if service already exists for this tenant
-        if tenant_id not in self._tenant_services:
-            # Check if we have config for this tenant
-            if tenant_id not in self._tenant_configs:
-                raise ValueError(f"No database configuration found for tenant: {tenant_id}")
-            
-            # Create new service for this tenant
-            db_config = self._tenant_configs[tenant_id]
-            print(f"Creating VannaService for tenant: {tenant_id}")
-            self._tenant_services[tenant_id] = VannaService(database_config=db_config)
+        service = self._touch_tenant_service(tenant_id)
+        if service is not None:
+            return service
+        
+        with self._tenant_lock(tenant_id):
+            # Another request may have built it while we waited
+            service = self._touch_tenant_service(tenant_id)
+            if service is None:
+                # Check if we have config for this tenant
+                if tenant_id not in self._tenant_configs:
+                    raise ValueError(f"No database configuration found for tenant: {tenant_id}")
+                
+                # Create new service for this tenant
+                db_config = self._tenant_configs[tenant_id]
+                logger.info("Creating VannaService for tenant: %s", tenant_id)
+                service = VannaService(database_config=db_config)
+                
+                evicted = []
+                with self._tenant_services_lock:
+                    self._tenant_services[tenant_id] = service
+                    self._tenant_last_used[tenant_id] = time.monotonic()
+                    while len(self._tenant_services) > self.max_tenant_services:
+                        evicted_id, evicted_service = self._tenant_services.popitem(last=False)
+                        del self._tenant_last_used[evicted_id]
+                        evicted.append((evicted_id, evicted_service))
+                
+                for evicted_id, evicted_service in evicted:
+                    self._close_service(evicted_service, f"evicted tenant {evicted_id}")
+        
+        return service
+    
+    def _touch_tenant_service(self, tenant_id: str) -> Optional[VannaService]:
+        """Get a tenant's existing service and mark it as most recently used"""
+        with self._tenant_services_lock:
+            service = self._tenant_services.get(tenant_id)
+            if service is not None:
+                self._tenant_services.move_to_end(tenant_id)
+                self._tenant_last_used[tenant_id] = time.monotonic()
+            return service
+    
+    def evict_idle(self) -> List[str]:
+        """Close tenant services unused for tenant_idle_ttl seconds, they are rebuilt on the next request"""
+        cutoff = time.monotonic() - self.tenant_idle_ttl
+        evicted = []
+        with self._tenant_services_lock:
+            # Least recently used first, so stop at the first service still in use
+            for tenant_id in list(self._tenant_services):
+                if self._tenant_last_used[tenant_id] > cutoff:
+                    break
+                evicted.append((tenant_id, self._tenant_services.pop(tenant_id)))
+                del self._tenant_last_used[tenant_id]
+        
+        for tenant_id, service in evicted:
+            self._close_service(service, f"idle tenant {tenant_id}")
+        return [tenant_id for tenant_id, _ in evicted]
+    
+    def _tenant_lock(self, tenant_id: str) -> threading.Lock:
+        """Get the lock serializing service creation for a tenant"""
+        with self._tenant_locks_lock:
+            return self._tenant_locks.setdefault(tenant_id, threading.Lock())
+    
+    def get_or_create(self, db_config: dict) -> VannaService:
+        """
+        Get VannaService for an ad-hoc database configuration. Creates if doesn't exist.
+        
+        Services are cached by configuration so repeated requests with the same
+        database_config reuse one service and its database connection.
+        """
+        config_key = tuple(sorted(db_config.items()))
         
-        return self._tenant_services[tenant_id]
+        service = self._touch_config_service(config_key)
+        if service is None:
+            service = self._config_inflight.do(config_key, self._create_config_service, config_key, db_config)
+        return service
+    
+    def _touch_config_service(self, config_key: Tuple) -> Optional[VannaService]:
+        """Get an existing service for a database config and mark it as most recently used"""
+        with self._config_lock:
+            service = self._config_services.get(config_key)
+            if service is not None:
+                self._config_services.move_to_end(config_key)
+            return service
+    
+    def _create_config_service(self, config_key: Tuple, db_config: dict) -> VannaService:
+        """Build and cache the service for a database config, without blocking other configs"""
+        # A build for this config may have finished just before this one started
+        service = self._touch_config_service(config_key)
+        if service is not None:
+            return service
+        
+        logger.info("Creating VannaService for database: %s:%s/%s", db_config.get('host'), db_config.get('port'), db_config.get('database'))
+        service = VannaService(database_config=dict(db_config))
+        
+        evicted = None
+        with self._config_lock:
+            self._config_services[config_key] = service
+            if len(self._config_services) > self.max_config_services:
+                _, evicted = self._config_services.popitem(last=False)
+        
+        if evicted is not None:
+            self._close_service(evicted, "evicted database config")
+        return service
+    
+    def _close_service(self, service: VannaService, name: str):
+        """Close a service, logging instead of raising on failure."""
+        if hasattr(service, 'close'):
+            try:
+                service.close()
+                logger.info("Closed service for %s", name)
+            except Exception as e:
+                logger.warning("Error closing service for %s: %s", name, e)
     
     def get_tenant_list(self) -> list:
         """Get list of registered tenant IDs."""
@@ -53,41 +181,50 @@ class ServiceManager:
     
     def remove_tenant(self, tenant_id: str):
         """Remove a tenant and cleanup their service."""
-        if tenant_id in self._tenant_services:
-            service = self._tenant_services.pop(tenant_id)
-            if hasattr(service, 'close'):
-                try:
-                    service.close()
-                    print(f"Closed service for tenant: {tenant_id}")
-                except Exception as e:
-                    print(f"Warning: Error closing service for tenant {tenant_id}: {e}")
+        with self._tenant_services_lock:
+            service = self._tenant_services.pop(tenant_id, None)
+            self._tenant_last_used.pop(tenant_id, None)
+        
+        if service is not None:
+            self._close_service(service, f"tenant {tenant_id}")
         
         if tenant_id in self._tenant_configs:
             self._tenant_configs.pop(tenant_id)
-            print(f"Removed tenant configuration: {tenant_id}")
+            logger.info("Removed tenant configuration: %s", tenant_id)
+        
+        with self._tenant_locks_lock:
+            self._tenant_locks.pop(tenant_id, None)
     
     def cleanup_all(self):
         """Cleanup all tenant services. Call this on app shutdown."""
-        print(f"Cleaning up {len(self._tenant_services)} tenant services...")
-        for tenant_id, service in self._tenant_services.items():
-            if hasattr(service, 'close'):
-                try:
-                    service.close()
-                    print(f"Closed service for tenant: {tenant_id}")
-                except Exception as e:
-                    print(f"Warning: Error closing service for tenant {tenant_id}: {e}")
-        
-        self._tenant_services.clear()
+        with self._tenant_services_lock:
+            services = list(self._tenant_services.items())
+            self._tenant_services.clear()
+            self._tenant_last_used.clear()
+        
+        logger.info("Cleaning up %d tenant services...", len(services))
+        for tenant_id, service in services:
+            self._close_service(service, f"tenant {tenant_id}")
+        
         self._tenant_configs.clear()
+        
+        with self._config_lock:
+            for service in self._config_services.values():
+                self._close_service(service, "database config")
+            self._config_services.clear()
     
     def get_stats(self) -> dict:
         """Get statistics about tenant services."""
         return {
             "registered_tenants": len(self._tenant_configs),
             "active_services": len(self._tenant_services),
+            "config_services": len(self._config_services),
             "tenant_list": self.get_tenant_list()
         }
 
 
 # Global service manager instance
-service_manager = ServiceManager()
\ No newline at end of file
+service_manager = ServiceManager(
+    max_tenant_services=settings.max_active_tenants,
+    tenant_idle_ttl=settings.tenant_idle_ttl
+)
\ No newline at end of file
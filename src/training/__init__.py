@@ -1,5 +1,3 @@
-try:
-    from .training_manager import TrainingManager
-    __all__ = ['TrainingManager']
-except ImportError:
-    __all__ = []
\ No newline at end of file
+from .training_manager import TrainingManager
+
+__all__ = ['TrainingManager']
\ No newline at end of file
@@ -1,4 +1,20 @@
-from typing import Dict, Any
+import logging
+from typing import Dict, Any, Iterator, List
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+def _records(df) -> List[Dict[str, Any]]:
+    """DataFrame rows as dicts, missing values (NaN) become None so they serialize as null"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _jsonable(value: Any) -> Any:
+    """orjson fallback: objects become their attribute dicts, anything else its string form"""
+    if hasattr(value, '__dict__'):
+        return vars(value)
+    return str(value)
 
 
 class TrainingManager:
@@ -32,6 +48,20 @@ class TrainingManager:
         except Exception as e:
             raise Exception(f"Failed to train SQL: {str(e)}")
     
+    def train_sql_batch(self, questions: List[str], sqls: List[str]) -> List[Dict[str, Any]]:
+        """Train the model with many question-SQL pairs in a single batch"""
+        if len(questions) != len(sqls):
+            raise ValueError("Question and SQL lists must have the same length")
+        
+        try:
+            self.vn.add_question_sql_batch(questions, sqls)
+            return [
+                {"status": "success", "message": "Question-SQL pair trained successfully"}
+                for _ in questions
+            ]
+        except Exception as e:
+            raise Exception(f"Failed to train SQL batch: {str(e)}")
+    
     def train_from_information_schema(self):
         """Train the model using database schema information"""
         try:
@@ -41,8 +71,8 @@ class TrainingManager:
             # Generate training plan
             plan = self.vn.get_training_plan_generic(df_information_schema)
             
-            # Execute training
-            self.vn.train(plan=plan)
+            # Execute training, embedding plan items in batches
+            self.vn.train_plan_batch(plan)
             
             return {
                 "status": "success", 
@@ -54,95 +84,65 @@ class TrainingManager:
     
     def get_training_data(self):
         """Get current training data"""
+        try:
+            return self._serializable(self.vn.get_training_data())
+        except Exception as e:
+            logger.debug("Error in get_training_data: %s", e)
+            raise Exception(f"Failed to get training data: {str(e)}")
+    
+    def get_training_data_json(self) -> bytes:
+        """Get current training data encoded as the {"training_data": [...]} response body"""
         try:
             raw_data = self.vn.get_training_data()
-            
-            # Check if raw_data is a pandas DataFrame
-            if hasattr(raw_data, 'to_dict'):
-                # It's a pandas DataFrame, convert to proper JSON format
-                try:
-                    # Convert DataFrame to list of dictionaries (records format)
-                    training_records = raw_data.to_dict('records')
-                    return training_records
-                except Exception as df_error:
-                    print(f"DEBUG: DataFrame conversion error: {df_error}")
-                    # Fallback: convert to dictionary format
-                    try:
-                        return {
-                            'columns': raw_data.columns.tolist(),
-                            'data': raw_data.values.tolist(),
-                            'index': raw_data.index.tolist()
-                        }
-                    except:
-                        # Final fallback: convert to string but in a structured way
-                        return {
-                            'training_data_summary': f"Found {len(raw_data)} training records",
-                            'columns': list(raw_data.columns) if hasattr(raw_data, 'columns') else [],
-                            'row_count': len(raw_data) if hasattr(raw_data, '__len__') else 0,
-                            'data_preview': str(raw_data.head() if hasattr(raw_data, 'head') else raw_data)
-                        }
-            
-            # If it's a list, process each item
-            elif isinstance(raw_data, list):
-                serializable_data = []
-                for item in raw_data:
-                    if hasattr(item, '__dict__'):
-                        # Convert object to dictionary
-                        item_dict = {}
-                        for key, value in vars(item).items():
-                            try:
-                                if isinstance(value, (str, int, float, bool, type(None))):
-                                    item_dict[key] = value
-                                elif isinstance(value, (list, dict)):
-                                    item_dict[key] = value
-                                else:
-                                    item_dict[key] = str(value)
-                            except:
-                                item_dict[key] = str(value)
-                        serializable_data.append(item_dict)
-                    elif isinstance(item, dict):
-                        # Already a dictionary, ensure values are serializable
-                        clean_dict = {}
-                        for key, value in item.items():
-                            try:
-                                if isinstance(value, (str, int, float, bool, type(None))):
-                                    clean_dict[key] = value
-                                elif isinstance(value, (list, dict)):
-                                    clean_dict[key] = value
-                                else:
-                                    clean_dict[key] = str(value)
-                            except:
-                                clean_dict[key] = str(value)
-                        serializable_data.append(clean_dict)
-                    else:
-                        serializable_data.append(str(item))
-                return serializable_data
-            
-            # If it's a dictionary
-            elif isinstance(raw_data, dict):
-                clean_dict = {}
-                for key, value in raw_data.items():
-                    try:
-                        if isinstance(value, (str, int, float, bool, type(None))):
-                            clean_dict[key] = value
-                        elif isinstance(value, (list, dict)):
-                            clean_dict[key] = value
-                        else:
-                            clean_dict[key] = str(value)
-                    except:
-                        clean_dict[key] = str(value)
-                return clean_dict
-            
-            # Fallback for other types
-            else:
-                return {
-                    'training_data_type': str(type(raw_data)),
-                    'training_data_summary': str(raw_data)[:500] + '...' if len(str(raw_data)) > 500 else str(raw_data)
-                }
-            
         except Exception as e:
-            print(f"DEBUG: Error in get_training_data: {e}")
             raise Exception(f"Failed to get training data: {str(e)}")
+        
+        # orjson writes NaN as null and numpy values natively, so DataFrame records need no cleanup pass
+        data = raw_data.to_dict('records') if hasattr(raw_data, 'to_dict') else self._serializable(raw_data)
+        return orjson.dumps({"training_data": data}, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    
+    def get_training_data_count(self) -> int:
+        """Get the number of training records without fetching them"""
+        try:
+            return self.vn.count_training_data()
+        except Exception as e:
+            raise Exception(f"Failed to count training data: {str(e)}")
+    
+    def iter_training_data(self, chunksize: int = 1000) -> Iterator[Any]:
+        """Yield training records, converting a DataFrame chunksize rows at a time"""
+        try:
+            raw_data = self.vn.get_training_data()
+        except Exception as e:
+            raise Exception(f"Failed to get training data: {str(e)}")
+        
+        if hasattr(raw_data, 'to_dict'):
+            for start in range(0, len(raw_data), chunksize):
+                yield from _records(raw_data.iloc[start:start + chunksize])
+            return
+        
+        data = self._serializable(raw_data)
+        if isinstance(data, list):
+            yield from data
+        else:
+            yield data
+    
+    @staticmethod
+    def _serializable(raw_data):
+        """Convert training data as returned by Vanna into JSON-serializable values"""
+        # Check if raw_data is a pandas DataFrame
+        if hasattr(raw_data, 'to_dict'):
+            return _records(raw_data)
+        
+        # Lists and dicts: one orjson round trip makes every nested value serializable
+        elif isinstance(raw_data, (list, dict)):
+            return orjson.loads(orjson.dumps(raw_data, default=_jsonable, option=orjson.OPT_NON_STR_KEYS))
+        
+        # Fallback for other types
+        else:
+            return {
+                'training_data_type': str(type(raw_data)),
+                'training_data_summary': str(raw_data)[:500] + '...' if len(str(raw_data)) > 500 else str(raw_data)
+            }
     
     def remove_training_data(self, id: str):
         """Remove training data by ID"""
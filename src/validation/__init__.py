@@ -1,7 +1,5 @@
-try:
-    from .sql_parser import SQLParser
-    from .pre_validator import PreValidator
-    from .post_validator import PostValidator
-    __all__ = ['SQLParser', 'PreValidator', 'PostValidator']
-except ImportError:
-    __all__ = []
\ No newline at end of file
+from .sql_parser import SQLParser
+from .pre_validator import PreValidator
+from .post_validator import PostValidator
+
+__all__ = ['SQLParser', 'PreValidator', 'PostValidator']
\ No newline at end of file
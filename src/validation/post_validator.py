@@ -1,6 +1,18 @@
+import logging
+import re
 from typing import Tuple
 from .sql_parser import SQLParser
 
+logger = logging.getLogger(__name__)
+
+# Statements generated SQL must never contain, with any whitespace or comments between their words
+_GAP = r'(?:\s|/\*.*?\*/|--[^\n]*)+'
+_SUSPICIOUS_RE = re.compile(
+    r'\b(drop{0}table|delete{0}from|truncate|alter{0}table|create{0}table)\b'.format(_GAP),
+    re.IGNORECASE | re.DOTALL
+)
+_GAP_RE = re.compile(_GAP, re.DOTALL)
+
 
 class PostValidator:
     """Post-validation of generated SQL against known schema"""
@@ -9,49 +21,39 @@ class PostValidator:
         self.schema_extractor = schema_extractor
         self.sql_parser = SQLParser()
     
+    def invalidate_schema_cache(self):
+        """Drop the cached known schema, call after DDL training data changes"""
+        self.schema_extractor.invalidate()
+    
     def validate_sql(self, sql: str) -> Tuple[bool, str]:
         """Post-validate generated SQL against known schema"""
         if not sql or not sql.strip():
             return False, "No SQL was generated."
         
         try:
-            import sqlparse
-            
-            # Parse the SQL
-            parsed = sqlparse.parse(sql)
-            if not parsed:
-                return False, "Generated SQL could not be parsed."
-            
-            # Extract table and column references from SQL
-            sql_lower = sql.lower()
+            # Check for common SQL injection patterns or suspicious content, cheap so it runs first
+            match = _SUSPICIOUS_RE.search(sql)
+            if match:
+                operation = _GAP_RE.sub(' ', match.group(1)).lower()
+                return False, f"Generated SQL contains potentially harmful operation: {operation}"
             
-            # Get known columns from DDL training data
-            known_columns = self.schema_extractor.get_known_columns_from_ddl()
-            known_tables = self.schema_extractor.get_known_tables_set()
+            # Get known columns and tables from DDL training data, lowercased
+            known_columns, known_tables = self.schema_extractor.get_known_schema_lower()
 
-            print(f"Known columns from DDL: {known_columns}")
+            logger.debug("Known columns from DDL: %s", known_columns)
 
             if known_columns:
+                # Extract column references from SQL, the only place the SQL gets tokenized
                 potential_columns = self.sql_parser.extract_identifiers(sql, known_tables)
-                print(f"Potential columns found in SQL: {potential_columns}")
+                logger.debug("Potential columns found in SQL: %s", potential_columns)
                 
-                invalid_columns = [col for col in potential_columns if col.lower() not in [kc.lower() for kc in known_columns]]
+                invalid_columns = [col for col in potential_columns if col.lower() not in known_columns]
                 if invalid_columns:
                     return False, f"Generated SQL references unknown columns: {', '.join(invalid_columns)}. Please rephrase your question."
-                            
-            # Check for common SQL injection patterns or suspicious content
-            suspicious_patterns = ['drop table', 'delete from', 'truncate', 'alter table', 'create table']
-            for pattern in suspicious_patterns:
-                if pattern in sql_lower:
-                    return False, f"Generated SQL contains potentially harmful operation: {pattern}"
             
             return True, "SQL validation passed"
             
-        except ImportError:
-            # sqlparse not available, skip detailed validation
-            print("Warning: sqlparse not available for SQL validation")
-            return True, "SQL validation skipped"
         except Exception as e:
-            print(f"Post-validation error: {e}")
+            logger.warning("Post-validation error: %s", e)
             # If validation fails, allow the SQL (fail-safe)
             return True, "Validation skipped due to error"
\ No newline at end of file
@@ -1,4 +1,18 @@
-from typing import Tuple
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Greetings and small talk that can be answered without searching or calling the LLM
+_SMALL_TALK_RE = re.compile(
+    r'^\s*(hi|hello|hey|halo|hai|help|test|ok|okay|thanks|thank you|terima kasih)[\s!.?]*$',
+    re.IGNORECASE
+)
+
+# Runs the per-collection similarity searches of concurrent validations
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="pre-validator")
 
 
 class PreValidator:
@@ -8,8 +22,20 @@ class PreValidator:
         self.vn = vn_client
         self.threshold = threshold
     
-    def validate_question(self, question: str) -> Tuple[bool, str]:
-        """Pre-validate question using Qdrant similarity search"""
+    def _has_related(self, collection_name: str, query_vector) -> bool:
+        """Whether a collection holds anything at least threshold-similar to the query"""
+        # One hit is enough and only its score matters, let Qdrant filter and skip the payload
+        results = self.vn._client.search(
+            collection_name,
+            query_vector=query_vector,
+            limit=1,
+            with_payload=False,
+            score_threshold=self.threshold,
+        )
+        return any(getattr(result, 'score', 0.0) >= self.threshold for result in results)
+    
+    def validate_question(self, question: str, query_vector: Optional[Sequence[float]] = None) -> Tuple[bool, str]:
+        """Pre-validate question using Qdrant similarity search, with the question's embedding if already computed"""
         if not question or not question.strip():
             return False, "Question cannot be empty."
         
@@ -17,41 +43,33 @@ class PreValidator:
         if len(question.strip()) < 3:
             return False, "Question is too short. Please provide a more detailed question."
         
+        if _SMALL_TALK_RE.match(question):
+            return False, "Please ask a question about your data, for example: total revenue last month."
+        
         try:
-            # Search for similar questions
-            similar_qs_raw = self.vn._client.search(
-                self.vn.sql_collection_name,
-                query_vector=self.vn.generate_embedding(question),
-                limit=self.vn.n_results,
-                with_payload=True,
-            )
-            similar_qs = [result for result in similar_qs_raw if hasattr(result, 'score') and getattr(result, 'score', 0.0) >= self.threshold]
-            
-            # Search for related DDL
-            related_ddl_raw = self.vn._client.search(
-                self.vn.ddl_collection_name,
-                query_vector=self.vn.generate_embedding(question),
-                limit=self.vn.n_results,
-                with_payload=True,
-            )
-            related_ddl = [result for result in related_ddl_raw if hasattr(result, 'score') and getattr(result, 'score', 0.0) >= self.threshold]
-            
-            # Search for related documentation
-            related_doc_raw = self.vn._client.search(
-                self.vn.documentation_collection_name,
-                query_vector=self.vn.generate_embedding(question),
-                limit=self.vn.n_results,
-                with_payload=True,
-            )
-            related_doc = [result for result in related_doc_raw if hasattr(result, 'score') and getattr(result, 'score', 0.0) >= self.threshold]
+            # Embed once and search questions, DDL and documentation at the same time
+            if query_vector is None:
+                query_vector = self.vn.generate_embedding(question)
+            else:
+                # Cosine search only depends on direction, so a normalized embedding works as is
+                query_vector = query_vector.tolist() if hasattr(query_vector, 'tolist') else list(query_vector)
+            searches = [
+                _SEARCH_POOL.submit(self._has_related, collection_name, query_vector)
+                for collection_name in (
+                    self.vn.sql_collection_name,
+                    self.vn.ddl_collection_name,
+                    self.vn.documentation_collection_name
+                )
+            ]
             
-            # Check if we found any relevant context
-            if not similar_qs and not related_ddl and not related_doc:
-                return False, "Sorry, your question does not match any known database context. Please clarify or rephrase your question."
+            # Any relevant context is enough, don't wait for the slower searches
+            for search in as_completed(searches):
+                if search.result():
+                    return True, "Valid question"
             
-            return True, "Valid question"
+            return False, "Sorry, your question does not match any known database context. Please clarify or rephrase your question."
             
         except Exception as e:
-            print(f"Pre-validation error: {e}")
+            logger.warning("Pre-validation error: %s", e)
             # If validation fails, allow the question to proceed (fail-safe)
             return True, "Validation skipped due to error"
\ No newline at end of file
@@ -1,161 +1,145 @@
-import sqlparse
-from sqlparse.tokens import Name, Keyword, Whitespace, Punctuation
-from typing import List, Set
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 
+logger = logging.getLogger(__name__)
 
-class SQLParser:
-    """SQL parsing utilities for extracting identifiers and validating SQL structure"""
+# Keywords and function names that are never column names, shared by every SQLParser
+_SQL_KEYWORDS: FrozenSet[str] = frozenset({
+    'SELECT', 'FROM', 'WHERE', 'GROUP', 'BY', 'ORDER', 'LIMIT', 'AS', 'DESC', 'ASC',
+    'AND', 'OR', 'NOT', 'IN', 'ON', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'FULL',
+    'UNION', 'ALL', 'DISTINCT', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'IS', 'NULL',
+    'BETWEEN', 'LIKE', 'HAVING', 'EXISTS', 'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'NOW',
+    'INTERVAL', 'MONTH', 'DAY', 'YEAR', 'HOUR', 'MINUTE', 'SECOND', 'DATE', 'TIME',
+    'CONCAT', 'SUBSTRING', 'UPPER', 'LOWER', 'TRIM', 'LENGTH', 'COALESCE', 'IFNULL',
+    'CAST', 'CONVERT', 'ROUND', 'FLOOR', 'CEIL', 'ABS', 'MOD', 'SQRT', 'POWER',
+    # Clause, literal and ClickHouse-specific keywords
+    'WITH', 'OFFSET', 'USING', 'OVER', 'PARTITION', 'ROWS', 'PRECEDING', 'FOLLOWING',
+    'UNBOUNDED', 'NULLS', 'FIRST', 'LAST', 'TRUE', 'FALSE', 'CROSS', 'ANY', 'GLOBAL',
+    'FINAL', 'PREWHERE', 'SAMPLE', 'SETTINGS', 'FORMAT', 'ARRAY', 'ILIKE', 'WEEK',
+    'QUARTER', 'TOP', 'ASOF', 'SEMI', 'ANTI', 'EXCEPT', 'INTERSECT', 'TIMESTAMP',
+    'TOTALS', 'ROLLUP', 'CUBE', 'FILL', 'TIES'
+})
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex source matching any of words, alternatives nested by common prefix like a trie"""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
     
-    def __init__(self):
-        self.sql_keywords = {
-            'SELECT', 'FROM', 'WHERE', 'GROUP', 'BY', 'ORDER', 'LIMIT', 'AS', 'DESC', 'ASC', 
-            'AND', 'OR', 'NOT', 'IN', 'ON', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'FULL', 
-            'UNION', 'ALL', 'DISTINCT', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'IS', 'NULL', 
-            'BETWEEN', 'LIKE', 'HAVING', 'EXISTS', 'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'NOW', 
-            'INTERVAL', 'MONTH', 'DAY', 'YEAR', 'HOUR', 'MINUTE', 'SECOND', 'DATE', 'TIME',
-            'CONCAT', 'SUBSTRING', 'UPPER', 'LOWER', 'TRIM', 'LENGTH', 'COALESCE', 'IFNULL',
-            'CAST', 'CONVERT', 'ROUND', 'FLOOR', 'CEIL', 'ABS', 'MOD', 'SQRT', 'POWER'
-        }
+    def walk(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + walk(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + pattern + ')?' if '' in node else pattern
     
-    def extract_identifiers(self, sql: str, known_tables: Set[str]) -> List[str]:
-        """Extract only column names from SQL, filtering out keywords, functions, table names, and aliases"""
-        try:
-            column_names = set()
-            defined_aliases = set()
-            
-            # Parse the SQL and get all tokens
-            parsed = sqlparse.parse(sql)
-            for statement in parsed:
-                tokens = list(statement.flatten())
-                
-                # First pass: collect all defined aliases
-                for i, token in enumerate(tokens):
-                    if (token.ttype is Name and token.value.strip() and 
-                        self._is_alias(tokens, i)):
-                        defined_aliases.add(token.value.strip().lower())
-                
-                # Second pass: extract column names
-                for i, token in enumerate(tokens):
-                    if token.ttype is Name and token.value.strip():
-                        name = token.value.strip()
-                        
-                        # Skip if it's a SQL keyword or function
-                        if name.upper() in self.sql_keywords:
-                            continue
-                            
-                        # Skip if it's a number or too short
-                        if name.isdigit() or len(name) <= 1:
-                            continue
-                        
-                        # Check if it's part of schema.table reference
-                        if self._is_schema_table_reference(tokens, i):
-                            continue
-                        
-                        # Check if it's a table name (with or without schema)
-                        if self._is_table_reference(name, known_tables):
-                            continue
-                            
-                        # Check if it's an alias (preceded by AS or follows a column/expression)
-                        if self._is_alias(tokens, i):
-                            continue
-                            
-                        # Check if it's a function name (followed by opening parenthesis)
-                        if self._is_function_name(tokens, i):
-                            continue
-                        
-                        # Check if it's a reference to a previously defined alias
-                        if name.lower() in defined_aliases:
-                            continue
-                            
-                        # If it passes all filters, it's likely a column name
-                        column_names.add(name)
-            
-            return list(column_names)
-            
-        except Exception as e:
-            print(f"Error extracting identifiers: {e}")
-            return []
+    return walk(trie)
+
+
+# One token per match, with the whitespace before it; strings, quoted identifiers and comments
+# are matched whole so nothing inside them is taken for an identifier. Keywords are recognized
+# while scanning, case-insensitively, so identifiers never need to be uppercased and looked up.
+# Runs of operators and punctuation are one token, comment starts (- and /) excepted
+_TOKEN_RE = re.compile(r"""
+  \s*(?:
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<str>'(?:[^'\\]|\\.|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`)
+  | (?P<num>\d\w*(?:\.\w*)?)
+  | (?P<alias_kw>(?ai:AS|END)(?!\w))
+  | (?P<kw>(?ai:%s)(?!\w))
+  | (?P<id>[^\W\d]\w*)
+  | (?P<dot>\.)
+  | (?P<lp>\()
+  | (?P<rp>\))
+  | (?P<other>[^\w\s'"`.()\-/]+|.)
+  )
+""" % _trie_pattern(_SQL_KEYWORDS), re.S | re.X)
+
+# Token kinds are the numbers of their groups, match.lastindex gives them without a name lookup
+_COMMENT, _ALIAS_KW, _ID, _DOT, _LP = (_TOKEN_RE.groupindex[name] for name in ('comment', 'alias_kw', 'id', 'dot', 'lp'))
+
+# Tokens ending an expression, a name directly after one is its alias ("sum(x) total", "users u")
+_ALIASABLE_KINDS: FrozenSet[int] = frozenset(_TOKEN_RE.groupindex[name] for name in ('id', 'rp', 'num', 'str', 'quoted'))
+
+# Tokens after which a name is a schema/database or a function, not a column
+_NOT_COLUMN_BEFORE: FrozenSet[int] = frozenset((_DOT, _LP))
+
+
+@lru_cache(maxsize=4096)
+def _extract_identifiers_cached(sql: str, known_tables: FrozenSet[str]) -> Tuple[str, ...]:
+    """Column names referenced by sql, cached since the same SQL is validated repeatedly"""
+    # Tokenize once into a list of kinds, keeping the text of identifiers only. Whitespace and
+    # comments never become tokens, so kinds[i - 1] and kinds[i + 1] are the neighbouring
+    # significant tokens; a sentinel on each side keeps those lookups in range
+    kinds: List[Optional[int]] = [None]
+    identifiers: List[Tuple[int, str]] = []
+    add_kind = kinds.append
+    add_identifier = identifiers.append
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastindex
+        if kind == _ID:
+            add_identifier((len(kinds), match.group(kind)))
+        if kind != _COMMENT:
+            add_kind(kind)
+    kinds += (None, None)
     
-    def _is_schema_table_reference(self, tokens: list, current_index: int) -> bool:
-        """Check if the current token is part of a schema.table reference"""
-        # Check if next token is a dot (schema.table pattern)
-        if current_index + 1 < len(tokens):
-            next_token = tokens[current_index + 1]
-            if next_token.ttype is Punctuation and next_token.value == '.':
-                return True  # This is the schema part
-        
-        # Check if previous token is a dot (schema.table pattern)
-        if current_index > 0:
-            prev_token = tokens[current_index - 1]
-            if prev_token.ttype is Punctuation and prev_token.value == '.':
-                return True  # This is the table part
-        
-        return False
+    candidates: List[Tuple[str, str]] = []
+    defined_aliases: Set[str] = set()
+    add_candidate = candidates.append
+    add_alias = defined_aliases.add
+    is_table = known_tables.__contains__
+    alias_kw, dot, lp = _ALIAS_KW, _DOT, _LP
     
-    def _is_function_name(self, tokens: list, current_index: int) -> bool:
-        """Check if the current token is a function name (followed by opening parenthesis)"""
-        # Look for opening parenthesis after current token (skipping whitespace)
-        for i in range(current_index + 1, min(len(tokens), current_index + 3)):
-            if tokens[i].ttype is Punctuation and tokens[i].value == '(':
-                return True
-            elif tokens[i].ttype not in (None, Whitespace):
-                break  # Found non-whitespace that's not parenthesis
+    # Only identifier positions are visited, everything else is context
+    for i, name in identifiers:
+        # Cheapest checks first: names too short to be columns and the table part of
+        # schema.table references are skipped without further work
+        prev_kind = kinds[i - 1]
+        if len(name) <= 1 or prev_kind == dot:
+            continue
         
-        return False
-    
-    def _is_table_reference(self, name: str, known_tables: set) -> bool:
-        """Check if name is a table reference (with or without schema)"""
         name_lower = name.lower()
+        next_kind = kinds[i + 1]
         
-        # Direct table name match
-        if name_lower in known_tables:
-            return True
-            
-        # Check if it's schema.table format
-        if '.' in name:
-            parts = name.split('.')
-            if len(parts) == 2:
-                # Check if the second part is a known table
-                table_part = parts[1].lower()
-                if table_part in known_tables:
-                    return True
-                # Also check full schema.table format
-                if name_lower in known_tables:
-                    return True
-        
-        return False
+        # Aliases: "expr AS name", or a name directly after an expression or CASE ... END
+        if (prev_kind == alias_kw or prev_kind in _ALIASABLE_KINDS) and next_kind != lp:
+            add_alias(name_lower)
+        # Common table expressions: "WITH name AS (SELECT ...)"
+        elif next_kind == alias_kw and kinds[i + 2] == lp:
+            add_alias(name_lower)
+        # Skip schema names, function names (followed by an opening parenthesis) and table names
+        elif next_kind not in _NOT_COLUMN_BEFORE and not is_table(name_lower):
+            add_candidate((name, name_lower))
     
-    def _is_alias(self, tokens: list, current_index: int) -> bool:
-        """Check if the current token is an alias"""
-        # Look for "AS" keyword before current token
-        for i in range(max(0, current_index - 3), current_index):
-            if (i < len(tokens) and 
-                tokens[i].ttype is Keyword and 
-                tokens[i].value.upper() == 'AS'):
-                return True
-        
-        # Look for patterns like "column_name alias_name" (without AS)
-        # Check if previous token could be a column/expression and this could be an alias
-        if current_index > 0:
-            prev_token = tokens[current_index - 1]
-            # Skip whitespace to find actual previous token
-            prev_index = current_index - 1
-            while prev_index >= 0 and prev_token.ttype in (None, Whitespace):
-                prev_index -= 1
-                if prev_index >= 0:
-                    prev_token = tokens[prev_index]
-            
-            # If previous token is a Name (could be column) or closing parenthesis (could be function)
-            if (prev_token.ttype is Name or 
-                (hasattr(prev_token, 'value') and prev_token.value == ')')):
-                # Check if we're in SELECT clause context (this is a simple heuristic)
-                # Look backwards for SELECT keyword
-                for j in range(prev_index, -1, -1):
-                    if (tokens[j].ttype is Keyword and 
-                        tokens[j].value.upper() in ['SELECT', 'FROM', 'WHERE', 'GROUP', 'ORDER']):
-                        if tokens[j].value.upper() == 'SELECT':
-                            return True  # Likely an alias in SELECT clause
-                        else:
-                            break  # Hit another clause, not in SELECT
-        
-        return False
\ No newline at end of file
+    # Aliases may be referenced before their definition, e.g. from an outer query.
+    # Deduplicated in order of appearance, so results and error messages are deterministic
+    return tuple(dict.fromkeys(name for name, name_lower in candidates if name_lower not in defined_aliases))
+
+
+class SQLParser:
+    """SQL parsing utilities for extracting identifiers and validating SQL structure"""
+    
+    def __init__(self) -> None:
+        self.sql_keywords: FrozenSet[str] = _SQL_KEYWORDS
+    
+    def extract_identifiers(self, sql: str, known_tables: Set[str]) -> Tuple[str, ...]:
+        """Extract only column names from SQL, filtering out keywords, functions, table names, and aliases"""
+        if not isinstance(known_tables, frozenset):
+            known_tables = frozenset(known_tables)
+        try:
+            return _extract_identifiers_cached(sql, known_tables)
+        except Exception as e:
+            logger.debug("Error extracting identifiers: %s", e)
+            return ()
+    
+    @staticmethod
+    def clear_cache() -> None:
+        """Drop cached extraction results"""
+        _extract_identifiers_cached.cache_clear()
\ No newline at end of file
@@ -1,36 +1,50 @@
-import os
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+import hashlib
+import re
+import threading
+from typing import Optional, Dict, Any, Generator, List, Iterator, Tuple
+import numpy as np
 
+from src.cache import SemanticCache, SingleFlight, TTLCache
+from src.config import Settings, settings as default_settings
 from src.llm import VannaQdrantClickHouse
 from src.database import ClickHouseClient, SchemaExtractor
 from src.validation import PreValidator, PostValidator
 from src.training import TrainingManager
-from src.database_prompts import DATABASE_PROMPTS
+from src.database_prompts import DATABASE_PROMPTS, SUPPORTED_DATABASE_TYPES
 
-# Load environment variables
-load_dotenv()
+# Generated text that is a query rather than an explanation or error message, checked
+# without copying or uppercasing the SQL
+_QUERY_RE = re.compile(r'\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+
+
+def _check_database_type(database_type: str):
+    """Raise ValueError if there is no prompt for database_type"""
+    if database_type not in DATABASE_PROMPTS:
+        raise ValueError(f"Unsupported database type: {database_type}. Supported types: {list(SUPPORTED_DATABASE_TYPES)}")
 
 
 class VannaService:
     """Main service class for text-to-SQL generation with validation and training"""
     
-    def __init__(self, database_config: Optional[Dict[str, Any]] = None):
-        # Get database type from environment
-        self.database_type = os.getenv('DATABASE_TYPE', 'clickhouse').lower()
+    def __init__(self, database_config: Optional[Dict[str, Any]] = None, settings: Optional[Settings] = None):
+        self.settings = settings or default_settings
+        
+        # Get database type from settings
+        self.database_type = self.settings.database_type.lower()
         
-        if self.database_type not in DATABASE_PROMPTS:
-            raise ValueError(f"Unsupported database type: {self.database_type}. Supported types: {list(DATABASE_PROMPTS.keys())}")
+        _check_database_type(self.database_type)
         
         # Initialize components
         self._init_database(database_config)
         self._init_llm()
         self._init_validators()
         self._init_training_manager()
+        self._init_sql_cache()
+        self._init_training_data_cache()
     
     def _init_database(self, database_config: Optional[Dict[str, Any]] = None):
         """Initialize database client"""
-        self.db_client = ClickHouseClient(database_config)
+        self.db_client = ClickHouseClient(database_config, settings=self.settings)
         
         # Set up the run_sql function for Vanna
         def run_sql_wrapper(sql: str):
@@ -40,7 +54,7 @@ class VannaService:
     
     def _init_llm(self):
         """Initialize LLM client"""
-        vanna_config = {'database_type': self.database_type}
+        vanna_config = {'database_type': self.database_type, 'settings': self.settings}
         self.vn = VannaQdrantClickHouse(config=vanna_config)
         
         # Set up the run_sql function for Vanna
@@ -57,107 +71,269 @@ class VannaService:
         """Initialize training manager"""
         self.training_manager = TrainingManager(self.vn, self.db_client)
     
+    def _init_sql_cache(self):
+        """Initialize caches of previously generated SQL and of the results of /ask queries"""
+        self.sql_cache = SemanticCache(
+            self.vn.generate_embedding,
+            threshold=self.settings.semantic_cache_threshold,
+            ttl=self.settings.sql_cache_ttl
+        )
+        self.result_cache = TTLCache(ttl=self.settings.result_cache_ttl, max_entries=256)
+        # Identical questions asked at the same time share one generation
+        self._sql_inflight = SingleFlight()
+    
+    def _init_training_data_cache(self):
+        """Initialize cache of the encoded training data response"""
+        self._train_version = 0
+        # Expires so that training handled by other worker processes becomes visible
+        self._training_data_payload = TTLCache(ttl=self.settings.training_data_cache_ttl, max_entries=1)
+        self._training_data_lock = threading.Lock()
+    
+    def _training_changed(self, schema: bool = False):
+        """Drop cached SQL and invalidate the cached training data payload, and the known schema if DDL changed"""
+        self.sql_cache.clear()
+        if schema:
+            self.post_validator.invalidate_schema_cache()
+        with self._training_data_lock:
+            self._train_version += 1
+            self._training_data_payload.clear()
+    
     def generate_sql(self, question: str) -> str:
+        """Generate SQL from natural language question, served from cache when possible"""
+        sql, embedding = self._get_cached_sql(question)
+        if sql is None:
+            sql = self._sql_inflight.do(self.sql_cache.normalize(question), self._generate_and_cache_sql, question, embedding)
+        return sql
+    
+    def generate_sql_stream(self, question: str) -> Iterator[Tuple[str, str]]:
+        """Generate SQL, yielding ("token", text) while the LLM writes and a final ("sql", sql).
+        Cached SQL, or SQL generated for an identical question already being answered, only
+        yields ("sql", sql)"""
+        sql, embedding = self._get_cached_sql(question)
+        if sql is None:
+            sql = yield from self._sql_inflight.do_iter(self.sql_cache.normalize(question), self._stream_and_cache_sql, question, embedding)
+        yield "sql", sql
+    
+    def _get_cached_sql(self, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return cached SQL for the question, or None, and the question embedding if it was computed"""
+        cached_sql = self.sql_cache.get_exact(question)
+        if cached_sql is not None:
+            return cached_sql, None
+        
+        embedding = self.sql_cache.embed(question)
+        return self.sql_cache.get_similar(embedding), embedding
+    
+    def _generate_and_cache_sql(self, question: str, embedding) -> str:
+        """Generate SQL and cache it if it is actual SQL and training did not change meanwhile"""
+        version = self.sql_cache.version
+        sql = self._generate_sql(question, embedding)
+        self._cache_sql(question, sql, embedding, version)
+        return sql
+    
+    def _stream_and_cache_sql(self, question: str, embedding) -> Generator[Tuple[str, str], None, str]:
+        """Like _generate_and_cache_sql, yielding the LLM events of _generate_sql_stream"""
+        version = self.sql_cache.version
+        sql = yield from self._generate_sql_stream(question, embedding)
+        self._cache_sql(question, sql, embedding, version)
+        return sql
+    
+    def _cache_sql(self, question: str, sql: str, embedding, version: int):
+        """Only cache actual SQL, not validation or error messages"""
+        if sql and _QUERY_RE.match(sql) is not None:
+            self.sql_cache.set(question, sql, embedding, version)
+    
+    def _generate_sql(self, question: str, embedding: Optional[np.ndarray] = None) -> str:
         """Generate SQL from natural language question with pre and post validation"""
         
-        # Pre-validation
-        is_valid, message = self.pre_validator.validate_question(question)
+        # Pre-validation, reusing the question embedding the SQL cache already computed
+        is_valid, message = self.pre_validator.validate_question(question, embedding)
         if not is_valid:
             return message
         
         try:
             # Generate SQL using Vanna
-            sql = self.vn.generate_sql(question, True)
-            
-            if not sql:
-                return "Sorry, I couldn't generate SQL for your question. Please try rephrasing it."
-            
-            # Post-validation
-            is_sql_valid, sql_message = self.post_validator.validate_sql(sql)
-            if not is_sql_valid:
-                return sql_message
-            
-            return str(sql)
-            
+            return self._post_validate(self.vn.generate_sql(question, True))
         except Exception as e:
             raise Exception(f"Failed to generate SQL: {str(e)}")
     
-    def run_sql(self, sql: str) -> Dict[str, Any]:
-        """Execute SQL and return results"""
+    def _generate_sql_stream(self, question: str, embedding: Optional[np.ndarray] = None) -> Generator[Tuple[str, str], None, str]:
+        """Like _generate_sql, yielding the events of vn.generate_sql_stream while the LLM writes"""
+        is_valid, message = self.pre_validator.validate_question(question, embedding)
+        if not is_valid:
+            return message
+        
+        try:
+            sql = yield from self.vn.generate_sql_stream(question, True)
+            return self._post_validate(sql)
+        except Exception as e:
+            raise Exception(f"Failed to generate SQL: {str(e)}")
+    
+    def _post_validate(self, sql: str) -> str:
+        """Return the generated SQL, or the message explaining why it is not usable"""
+        if not sql:
+            return "Sorry, I couldn't generate SQL for your question. Please try rephrasing it."
+        
+        is_sql_valid, sql_message = self.post_validator.validate_sql(sql)
+        if not is_sql_valid:
+            return sql_message
+        
+        return str(sql)
+    
+    def run_sql(self, sql: str, layout: str = 'records') -> Dict[str, Any]:
+        """Execute SQL and return results, data as a list of row dicts or, with layout='columns',
+        as one list of values per column"""
         try:
-            results_df = self.db_client.run_sql(sql)
-            # Convert DataFrame to dict for JSON serialization
+            # Plain Python values straight from the driver, no DataFrame in between
+            if layout == 'columns':
+                # One sequence per column, no per-row dicts
+                columns, values = self.db_client.query(sql, column_oriented=True)
+                data = dict(zip(columns, values))
+                row_count = len(values[0]) if values else 0
+            else:
+                columns, rows = self.db_client.query(sql)
+                data = [dict(zip(columns, row)) for row in rows]
+                row_count = len(rows)
             results = {
-                'columns': results_df.columns.tolist(),
-                'data': results_df.to_dict('records'),
-                'row_count': len(results_df)
+                'columns': columns,
+                'data': data,
+                'row_count': row_count
             }
             return results
         except Exception as e:
             raise Exception(f"Failed to execute SQL: {str(e)}")
     
-    def ask(self, question: str) -> Dict[str, Any]:
-        """Ask a question and get both SQL and results"""
-        try:
-            # Generate SQL with validation
-            sql = self.generate_sql(question)
-            
-            # If SQL generation failed (returned error message), return the message
-            if not sql or not sql.strip().upper().startswith('SELECT'):
-                return {
-                    'sql': "",
-                    'error': sql if sql else "Failed to generate SQL",
-                    'results': {}
-                }
-            
-            # Execute SQL
-            results = self.run_sql(sql)
-            
-            return {
-                'sql': sql,
-                'results': results
-            }
-        except Exception as e:
+    def run_sql_iter(self, sql: str) -> Iterator[Dict[str, Any]]:
+        """Execute SQL and yield result rows without materializing the full result"""
+        return self.db_client.iter_rows(sql)
+    
+    def ask(self, question: str, layout: str = 'records') -> Dict[str, Any]:
+        """Ask a question and get both SQL and results, LLM and database errors are raised"""
+        # Generate SQL with validation
+        sql = self.generate_sql(question)
+        
+        # If SQL generation failed (returned error message), return the message
+        if not sql or _QUERY_RE.match(sql) is None:
             return {
                 'sql': "",
-                'error': f"Failed to process question: {str(e)}",
+                'error': sql if sql else "Failed to generate SQL",
                 'results': {}
             }
+        
+        return {
+            'sql': sql,
+            'results': self._run_cached_sql(sql, layout)
+        }
+    
+    def ask_stream(self, question: str, layout: str = 'records') -> Iterator[Tuple[str, Any]]:
+        """Ask a question, yielding the events of generate_sql_stream, then ("results", results)
+        or ("error", message) if no SQL could be generated"""
+        sql = ""
+        for event, text in self.generate_sql_stream(question):
+            if event == "sql":
+                sql = text
+            yield event, text
+        
+        if not sql or _QUERY_RE.match(sql) is None:
+            yield "error", sql if sql else "Failed to generate SQL"
+            return
+        
+        yield "results", self._run_cached_sql(sql, layout)['data']
+    
+    def _run_cached_sql(self, sql: str, layout: str) -> Dict[str, Any]:
+        """Execute SQL, similar questions resolve to the same cached SQL and so share its results"""
+        results = self.result_cache.get((sql, layout))
+        if results is None:
+            results = self.run_sql(sql, layout)
+            self.result_cache.set((sql, layout), results)
+        return results
     
     # Training methods (delegated to TrainingManager)
+    # Training changes the retrieval context, so cached SQL and training data are dropped
     def train_ddl(self, ddl: str):
-        return self.training_manager.train_ddl(ddl)
+        result = self.training_manager.train_ddl(ddl)
+        self._training_changed(schema=True)
+        return result
     
     def train_documentation(self, documentation: str):
-        return self.training_manager.train_documentation(documentation)
+        result = self.training_manager.train_documentation(documentation)
+        self._training_changed()
+        return result
     
     def train_sql(self, question: str, sql: str):
-        return self.training_manager.train_sql(question, sql)
+        result = self.training_manager.train_sql(question, sql)
+        self._training_changed()
+        return result
+    
+    def train_sql_batch(self, questions: List[str], sqls: List[str]):
+        results = self.training_manager.train_sql_batch(questions, sqls)
+        self._training_changed()
+        return results
     
     def train_from_information_schema(self):
-        return self.training_manager.train_from_information_schema()
+        result = self.training_manager.train_from_information_schema()
+        self._training_changed(schema=True)
+        return result
     
     def get_training_data(self):
         return self.training_manager.get_training_data()
     
+    def get_training_data_count(self) -> int:
+        return self.training_manager.get_training_data_count()
+    
+    def iter_training_data(self) -> Iterator[Any]:
+        return self.training_manager.iter_training_data()
+    
+    def get_training_data_payload(self) -> Tuple[str, bytes]:
+        """Get the JSON-encoded training data response and its ETag, cached until training in this
+        process changes it or training_data_cache_ttl expires"""
+        with self._training_data_lock:
+            version = self._train_version
+            payload = self._training_data_payload.get('payload')
+            if payload is not None:
+                return payload
+        
+        body = self.training_manager.get_training_data_json()
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        
+        with self._training_data_lock:
+            # Only cache if no training happened while the data was being fetched
+            if self._train_version == version:
+                self._training_data_payload.set('payload', (etag, body))
+        return etag, body
+    
     def remove_training_data(self, id: str):
-        return self.training_manager.remove_training_data(id)
+        result = self.training_manager.remove_training_data(id)
+        self._training_changed(schema=True)
+        return result
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Statistics of the caches in front of the LLM"""
+        return {
+            "prompt_cache": self.vn.prompt_cache.stats(),
+            "sql_cache": self.sql_cache.stats(),
+            "result_cache": self.result_cache.stats()
+        }
+    
+    def close(self):
+        """Release the database connection held by this service"""
+        self.db_client.close()
     
     # Configuration methods
     def update_config(self, database_config: Dict[str, Any]):
         """Update database configuration"""
         self.db_client.update_config(database_config)
+        self.result_cache.clear()
         return {"status": "success", "message": "Database configuration updated"}
     
     def set_database_type(self, database_type: str):
         """Change the database type and update the context"""
         database_type = database_type.lower()
         
-        if database_type not in DATABASE_PROMPTS:
-            raise ValueError(f"Unsupported database type: {database_type}. Supported types: {list(DATABASE_PROMPTS.keys())}")
+        _check_database_type(database_type)
         
         self.database_type = database_type
         self.vn.database_type = database_type
+        self.sql_cache.clear()
         
         return {
             "status": "success", 
@@ -169,7 +345,7 @@ class VannaService:
         """Get current database type and available types"""
         return {
             "current_database_type": self.database_type,
-            "available_types": list(DATABASE_PROMPTS.keys())
+            "available_types": SUPPORTED_DATABASE_TYPES
         }
     
     def get_database_contexts(self):
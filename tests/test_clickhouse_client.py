@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test that shared ClickHouse clients are released with the last service using them
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import src.database.clickhouse_client as clickhouse_client
+from src.database import ClickHouseClient
+
+CONFIG = {'host': 'clickhouse', 'port': 8123, 'user': 'default', 'password': '', 'database': 'sales'}
+
+
+class FakePoolManager:
+    """Counts how often its pooled connections are closed"""
+
+    def __init__(self):
+        self.cleared = 0
+
+    def clear(self):
+        self.cleared += 1
+
+
+def _fake_clients(monkeypatch):
+    built = []
+    monkeypatch.setattr(clickhouse_client, "get_pool_manager", lambda **options: FakePoolManager())
+
+    def get_client(**params):
+        built.append(params)
+        return object()
+
+    monkeypatch.setattr(clickhouse_client.clickhouse_connect, "get_client", get_client)
+    return built
+
+
+def test_client_shared_until_last_close(monkeypatch):
+    """Services with the same config share one client, released when the last one closes"""
+    built = _fake_clients(monkeypatch)
+
+    first = ClickHouseClient(CONFIG)
+    second = ClickHouseClient(dict(CONFIG))
+    assert len(built) == 1
+    assert first.client is second.client
+    pool_mgr = built[0]['pool_mgr']
+
+    first.close()
+    first.close()
+    assert pool_mgr.cleared == 0
+
+    second.close()
+    assert pool_mgr.cleared == 1
+    assert not clickhouse_client._CLIENTS and not clickhouse_client._POOL_MGRS
+
+    # A new service for the config builds a new client
+    ClickHouseClient(CONFIG).close()
+    assert len(built) == 2
+
+
+def test_server_connections_kept_while_another_database_uses_them(monkeypatch):
+    """Clients of other databases on the same server keep the server's connections open"""
+    built = _fake_clients(monkeypatch)
+
+    sales = ClickHouseClient(CONFIG)
+    finance = ClickHouseClient({**CONFIG, 'database': 'finance'})
+    pool_mgr = built[0]['pool_mgr']
+    assert built[1]['pool_mgr'] is pool_mgr
+
+    sales.close()
+    assert pool_mgr.cleared == 0
+    finance.close()
+    assert pool_mgr.cleared == 1
+
+
+def test_update_config_releases_previous_client(monkeypatch):
+    """Switching databases releases the client of the previous config"""
+    _fake_clients(monkeypatch)
+
+    client = ClickHouseClient(CONFIG)
+    client.update_config({**CONFIG, 'database': 'finance'})
+    assert list(clickhouse_client._CLIENTS) == [('clickhouse', 8123, 'default', '', 'finance')]
+
+    client.close()
+    assert not clickhouse_client._CLIENTS
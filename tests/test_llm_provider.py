@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test that LLM_PROVIDER selects the LLM client used by VannaQdrantClickHouse
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+from qdrant_client import QdrantClient
+
+from src.config import LLMConfig, Settings
+from src.llm import CustomCompatibleLLM, VannaQdrantClickHouse
+
+
+class FakeCompletions:
+    """Records chat completion requests instead of sending them"""
+
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **params):
+        self.requests.append(params)
+        message = type("Message", (), {"content": "SELECT 1"})()
+        choice = type("Choice", (), {"message": message})()
+        return type("Response", (), {"choices": [choice]})()
+
+
+def _make_vanna(monkeypatch, **settings):
+    # No collections are needed, and creating them would load the embedding model
+    monkeypatch.setattr(VannaQdrantClickHouse, "_setup_collections", lambda self: None)
+    return VannaQdrantClickHouse(config={
+        'settings': Settings(_env_file=None, **settings),
+        'qdrant_client': QdrantClient(location=":memory:")
+    })
+
+
+def test_openai_provider(monkeypatch):
+    """LLM_PROVIDER=openai uses the OpenAI endpoint and model, without a Qwen key"""
+    vn = _make_vanna(
+        monkeypatch,
+        llm_provider='openai',
+        openai_api_key='test-key',
+        openai_model='gpt-4o-mini',
+        qwen_api_key=None,
+        dashscope_api_key=None
+    )
+
+    assert isinstance(vn, CustomCompatibleLLM)
+    assert vn.provider == 'openai'
+    assert str(vn.client.base_url).startswith(Settings.model_fields['openai_base_url'].default)
+
+    completions = FakeCompletions()
+    monkeypatch.setattr(vn.client.chat, "completions", completions)
+    assert vn.submit_prompt("How many orders were placed today?") == "SELECT 1"
+
+    request = completions.requests[0]
+    assert request['model'] == 'gpt-4o-mini'
+    # Qwen-only parameters are not sent to other providers
+    assert 'top_p' not in request
+
+
+def test_qwen_provider(monkeypatch):
+    """The default provider stays Qwen, with its extra parameters"""
+    vn = _make_vanna(monkeypatch, llm_provider='qwen', qwen_api_key='test-key', qwen_model='qwen-plus')
+
+    completions = FakeCompletions()
+    monkeypatch.setattr(vn.client.chat, "completions", completions)
+    vn.submit_prompt("How many orders were placed today?")
+
+    request = completions.requests[0]
+    assert request['model'] == 'qwen-plus'
+    assert request['top_p'] == LLMConfig.PROVIDERS['qwen']['extra_params']['top_p']
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test that ServiceManager builds one service per tenant and closes the ones it evicts
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import threading
+import time
+
+import pytest
+
+import src.service_manager as service_manager_module
+from src.service_manager import ServiceManager
+
+
+class FakeService:
+    """Stands in for VannaService, which would connect to ClickHouse and Qdrant"""
+
+    built = []
+    # Seconds a build takes, long enough for concurrent requests to race
+    build_time = 0.0
+
+    def __init__(self, database_config=None):
+        time.sleep(self.build_time)
+        self.database_config = database_config
+        self.closed = False
+        FakeService.built.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    FakeService.built = []
+    monkeypatch.setattr(service_manager_module, "VannaService", FakeService)
+    clock = FakeClock()
+    monkeypatch.setattr(service_manager_module, "time", clock)
+    return clock
+
+
+def _manager(tenant_ids, **limits):
+    manager = ServiceManager(**limits)
+    for tenant_id in tenant_ids:
+        manager.register_tenant(tenant_id, {'database': tenant_id})
+    return manager
+
+
+def test_racing_requests_build_one_service(clock, monkeypatch):
+    monkeypatch.setattr(FakeService, "build_time", 0.1)
+    manager = _manager(["acme"])
+    services = []
+
+    threads = [threading.Thread(target=lambda: services.append(manager.get_service("acme"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(FakeService.built) == 1
+    assert all(service is FakeService.built[0] for service in services)
+
+
+def test_unknown_tenant(clock):
+    with pytest.raises(ValueError, match="No database configuration found for tenant: nobody"):
+        _manager([]).get_service("nobody")
+
+
+def test_least_recently_used_service_is_closed(clock):
+    manager = _manager(["a", "b", "c"], max_tenant_services=2)
+    a = manager.get_service("a")
+    b = manager.get_service("b")
+    # Using a again makes b the least recently used
+    assert manager.get_service("a") is a
+
+    c = manager.get_service("c")
+
+    assert b.closed
+    assert not a.closed and not c.closed
+    assert manager.get_stats()["active_services"] == 2
+    # An evicted tenant is rebuilt on its next request
+    assert manager.get_service("b") is not b
+    assert a.closed
+
+
+def test_evict_idle_closes_unused_services(clock):
+    manager = _manager(["a", "b", "c"], tenant_idle_ttl=60)
+    a = manager.get_service("a")
+    b = manager.get_service("b")
+    clock.now += 30
+    c = manager.get_service("c")
+    clock.now += 20
+    # Using a again leaves b as the only service idle for over 60 seconds below
+    manager.get_service("a")
+    clock.now += 15
+
+    assert manager.evict_idle() == ["b"]
+    assert b.closed
+    assert not a.closed and not c.closed
+
+    clock.now += 60
+    assert manager.evict_idle() == ["c", "a"]
+    assert a.closed and c.closed
+    assert manager.get_stats()["active_services"] == 0
+
+
+def test_remove_tenant_closes_its_service(clock):
+    manager = _manager(["a"])
+    a = manager.get_service("a")
+
+    manager.remove_tenant("a")
+
+    assert a.closed
+    assert manager.get_tenant_list() == []
+    with pytest.raises(ValueError):
+        manager.get_service("a")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test that SingleFlight runs concurrent identical calls once and shares their outcome
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import threading
+import time
+
+import pytest
+
+from src.cache import SingleFlight
+
+CALLERS = 8
+
+
+def _run_concurrently(target):
+    threads = [threading.Thread(target=target) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_identical_calls_run_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def generate(question):
+        calls.append(question)
+        release.wait(5)
+        return f"SELECT '{question}'"
+
+    threads = _run_concurrently(lambda: results.append(flight.do("key", generate, "q")))
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["q"]
+    assert results == ["SELECT 'q'"] * CALLERS
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    errors = []
+
+    def fail():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("LLM unavailable")
+
+    def call():
+        try:
+            flight.do("key", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = _run_concurrently(call)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == CALLERS
+    assert all(str(e) == "LLM unavailable" for e in errors)
+
+
+def test_finished_call_is_not_reused():
+    """Only concurrent callers share a call, later ones run their own"""
+    flight = SingleFlight()
+    calls = []
+    for _ in range(3):
+        flight.do("key", calls.append, 1)
+    assert len(calls) == 3
+
+    with pytest.raises(KeyError):
+        flight.do("key", {}.__getitem__, "missing")
+    assert flight.do("key", len, "ok") == 2
+
+
+def test_do_iter_streams_to_the_leader_only():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    outcomes = []
+
+    def stream():
+        calls.append(1)
+        yield "token"
+        release.wait(5)
+        return "SELECT 1"
+
+    def call():
+        events = flight.do_iter("key", stream)
+        items = []
+        try:
+            while True:
+                items.append(next(events))
+        except StopIteration as stop:
+            outcomes.append((items, stop.value))
+
+    threads = _run_concurrently(call)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(outcomes) == [([], "SELECT 1")] * (CALLERS - 1) + [(["token"], "SELECT 1")]
+
+
+def test_abandoned_do_iter_is_run_again_by_a_waiter():
+    """A streaming caller that disconnects leaves nothing to share, the next caller runs the call"""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def stream():
+        yield "token"
+        return "SELECT 1"
+
+    leader = flight.do_iter("key", stream)
+    assert next(leader) == "token"
+
+    results = []
+    waiter = threading.Thread(target=lambda: (started.set(), results.append(flight.do("key", lambda: "SELECT 2"))))
+    waiter.start()
+    started.wait(5)
+    time.sleep(0.1)
+    leader.close()
+    waiter.join(5)
+
+    assert results == ["SELECT 2"]
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test that the generated-SQL cache does not serve SQL written for a different question
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+from src.cache import SemanticCache
+from src.config import Settings
+
+# Questions differing only in their time window, as used by the temporal tests
+NEAR_MISSES = [
+    ("total penjualan minggu lalu", "total penjualan bulan lalu"),
+    ("total sales last week", "total sales last month"),
+]
+
+
+def _embed(question):
+    """Stand-in embedding scoring near misses as near duplicates (cosine > 0.99)"""
+    return [1.0, 0.05 * len(question)]
+
+
+def _sql_for(question):
+    return f"SELECT sum(grand_total) FROM orders -- {question}"
+
+
+def test_near_miss_questions_do_not_share_sql():
+    """With the default settings only the same question is a cache hit"""
+    cache = SemanticCache(_embed, threshold=Settings(_env_file=None).semantic_cache_threshold)
+
+    for cached_question, other_question in NEAR_MISSES:
+        cache.set(cached_question, _sql_for(cached_question), cache.embed(cached_question))
+
+        assert cache.get_exact(other_question) is None
+        assert cache.get_similar(cache.embed(other_question)) is None
+        # The same question, however it is typed, is still served from cache
+        assert cache.get_exact(cached_question.upper() + "  ") == _sql_for(cached_question)
+
+
+def test_similarity_tier_is_opt_in():
+    """A configured threshold enables reuse for similar questions"""
+    cache = SemanticCache(_embed, threshold=0.92)
+    cached_question, other_question = NEAR_MISSES[0]
+    cache.set(cached_question, _sql_for(cached_question), cache.embed(cached_question))
+
+    assert cache.get_similar(cache.embed(other_question)) == _sql_for(cached_question)
+
+
+def test_storing_a_question_again_replaces_its_similarity_entry():
+    """Re-caching a question, e.g. after its entry expired, keeps one entry for it"""
+    cache = SemanticCache(_embed, threshold=0.92)
+    question, _ = NEAR_MISSES[0]
+    for attempt in range(5):
+        cache.set(question, f"SELECT {attempt}", cache.embed(question))
+
+    assert cache.stats()["similar_entries"] == 1
+    assert cache.get_similar(cache.embed(question)) == "SELECT 4"
+
+
+def test_similarity_entries_are_bounded():
+    """Beyond max_entries the oldest similarity entries are overwritten"""
+    one_hot = lambda question: [float(i == int(question)) for i in range(50)]
+    cache = SemanticCache(one_hot, threshold=0.92, max_entries=20)
+    for i in range(50):
+        cache.set(str(i), f"SELECT {i}", cache.embed(str(i)))
+
+    assert cache.stats()["similar_entries"] == 20
+    assert cache.get_similar(cache.embed("49")) == "SELECT 49"
+    assert cache.get_similar(cache.embed("30")) == "SELECT 30"
+    assert cache.get_similar(cache.embed("29")) is None
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test streamed SQL generation: identical questions share one LLM call and an
+intermediate_sql response is not generated twice
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import threading
+import time
+
+import pandas as pd
+from qdrant_client import QdrantClient
+
+from src.cache import SemanticCache, SingleFlight
+from src.config import Settings
+from src.llm import VannaQdrantClickHouse
+from src.vanna_service import VannaService
+
+FINAL_SQL = "SELECT count(*) FROM orders WHERE status = 'paid';"
+
+
+class AcceptAll:
+    """Pre and post validator accepting every question and query"""
+
+    def validate_question(self, question, query_vector=None):
+        return True, ""
+
+    def validate_sql(self, sql):
+        return True, ""
+
+
+def _make_service(vn):
+    service = object.__new__(VannaService)
+    service.vn = vn
+    service.pre_validator = service.post_validator = AcceptAll()
+    service.sql_cache = SemanticCache(lambda question: [1.0, 0.0])
+    service._sql_inflight = SingleFlight()
+    return service
+
+
+def _make_vanna(monkeypatch, responses):
+    """VannaQdrantClickHouse answering streamed prompts with responses, in order"""
+    monkeypatch.setattr(VannaQdrantClickHouse, "_setup_collections", lambda self: None)
+    vn = VannaQdrantClickHouse(config={
+        'settings': Settings(_env_file=None, qwen_api_key='test-key'),
+        'qdrant_client': QdrantClient(location=":memory:")
+    })
+    # No retrieval context, that would load the embedding model
+    vn.get_similar_question_sql = vn.get_related_ddl = vn.get_related_documentation = lambda question, **kwargs: []
+    vn.prompts = []
+
+    def submit_prompt_streaming(prompt, **kwargs):
+        vn.prompts.append(prompt)
+        response = responses[len(vn.prompts) - 1]
+        yield response[:10]
+        yield response[10:]
+
+    vn.submit_prompt_streaming = submit_prompt_streaming
+    return vn
+
+
+def test_intermediate_sql_reuses_streamed_response(monkeypatch):
+    """The first completion's intermediate query is run, only the final prompt is sent again"""
+    vn = _make_vanna(monkeypatch, [
+        "-- intermediate_sql\nSELECT DISTINCT status FROM orders;",
+        FINAL_SQL,
+    ])
+    vn.run_sql = lambda sql: pd.DataFrame({"status": ["paid", "open"]})
+
+    events = list(_make_service(vn).generate_sql_stream("How many paid orders?"))
+
+    assert len(vn.prompts) == 2
+    assert "SELECT DISTINCT status FROM orders;" in str(vn.prompts[1])
+    assert ("intermediate_sql", "SELECT DISTINCT status FROM orders;") in events
+    assert events[-1] == ("sql", FINAL_SQL)
+    # Tokens after the intermediate_sql event are the final answer's
+    after = events[events.index(("intermediate_sql", "SELECT DISTINCT status FROM orders;")) + 1:-1]
+    assert "".join(text for event, text in after) == FINAL_SQL
+
+
+class BlockingVanna:
+    """Streams FINAL_SQL once released, counting the generations"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def generate_sql_stream(self, question, allow_llm_to_see_data=False):
+        self.calls += 1
+        yield "token", FINAL_SQL[:6]
+        self.release.wait(5)
+        yield "token", FINAL_SQL[6:]
+        return FINAL_SQL
+
+
+def test_identical_streamed_questions_share_one_generation():
+    """Questions arriving while the same one is being streamed wait for its SQL"""
+    vn = BlockingVanna()
+    service = _make_service(vn)
+    results = []
+
+    def ask():
+        results.append(list(service.generate_sql_stream("How many paid orders?")))
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    vn.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert vn.calls == 1
+    assert all(events[-1] == ("sql", FINAL_SQL) for events in results)
+    # Only the caller that ran the generation saw its tokens
+    assert sorted(len(events) for events in results) == [1, 1, 1, 3]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test the validation of generated SQL: blocked statements, and the column check
+ignoring names in comments and string literals
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+
+from src.validation import PostValidator, SQLParser
+
+KNOWN_COLUMNS = frozenset({'order_id', 'total', 'status', 'note', 'created_at', 'customer_id', 'name'})
+KNOWN_TABLES = frozenset({'orders', 'customers', 'sales.orders'})
+
+
+class FakeSchemaExtractor:
+    """Known schema as loaded from DDL training data"""
+
+    def get_known_schema_lower(self):
+        return KNOWN_COLUMNS, KNOWN_TABLES
+
+    def invalidate(self):
+        pass
+
+
+@pytest.fixture
+def validator():
+    SQLParser.clear_cache()
+    return PostValidator(FakeSchemaExtractor())
+
+
+def _columns(sql):
+    return list(SQLParser().extract_identifiers(sql, KNOWN_TABLES))
+
+
+@pytest.mark.parametrize("sql, operation", [
+    ("DROP TABLE orders", "drop table"),
+    ("SELECT 1; delete from orders WHERE 1", "delete from"),
+    ("TRUNCATE orders", "truncate"),
+    ("ALTER TABLE orders DELETE WHERE 1", "alter table"),
+    ("create table copy AS SELECT * FROM orders", "create table"),
+    # Any case and whitespace between the words
+    ("SELECT 1;\nDrop\n\tTable orders", "drop table"),
+    # Comments between the words are whitespace to ClickHouse
+    ("SELECT 1; DROP/**/TABLE orders", "drop table"),
+    ("SELECT 1; DELETE -- rows\nFROM orders", "delete from"),
+    # Blocked even inside string literals and comments
+    ("SELECT 'drop table orders' AS note", "drop table"),
+    ("SELECT order_id FROM orders -- then truncate orders", "truncate"),
+])
+def test_blocked_operations(validator, sql, operation):
+    is_valid, message = validator.validate_sql(sql)
+    assert not is_valid
+    assert message == f"Generated SQL contains potentially harmful operation: {operation}"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT order_id, total FROM orders WHERE status = 'paid'",
+    # Words only containing a blocked keyword
+    "SELECT order_id AS dropped_table FROM orders",
+])
+def test_allowed_queries(validator, sql):
+    assert validator.validate_sql(sql) == (True, "SQL validation passed")
+
+
+def test_empty_sql_is_rejected(validator):
+    assert validator.validate_sql("  ") == (False, "No SQL was generated.")
+
+
+def test_unknown_column_is_rejected(validator):
+    is_valid, message = validator.validate_sql("SELECT order_id, discount FROM orders")
+    assert not is_valid
+    assert "unknown columns: discount" in message
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT order_id, total FROM orders -- secret_col",
+    "SELECT order_id FROM orders /* secret_col, other_col */ WHERE total > 10",
+    "SELECT order_id FROM orders WHERE status = 'unknown_col'",
+    "SELECT order_id FROM orders WHERE note = 'it''s unknown_col'",
+    "SELECT order_id FROM orders WHERE note = 'a\\' unknown_col'",
+    "SELECT order_id FROM orders WHERE note = '-- unknown_col'",
+])
+def test_names_in_comments_and_strings_are_not_columns(validator, sql):
+    assert validator.validate_sql(sql) == (True, "SQL validation passed")
+
+
+@pytest.mark.parametrize("sql, columns", [
+    # Keywords, function names and quoted identifiers
+    ("SELECT DISTINCT toStartOfMonth(created_at) FROM orders ORDER BY 1 DESC", ['created_at']),
+    ('SELECT "Weird Col" FROM orders', []),
+    # Aliases, with and without AS, also when referenced later
+    ("SELECT count(order_id) AS cnt, sum(total) revenue FROM orders GROUP BY cnt", ['order_id', 'total']),
+    ("SELECT CASE WHEN total > 10 THEN 'big' ELSE 'small' END size FROM orders", ['total']),
+    # Schema-qualified tables and table aliases
+    ("SELECT o.order_id FROM sales.orders o", []),
+    ("SELECT c.name FROM orders AS o JOIN customers AS c ON o.customer_id = c.customer_id", []),
+    # Results are deduplicated in order of appearance
+    ("SELECT total, status FROM orders WHERE total > 0 AND status != ''", ['total', 'status']),
+])
+def test_extract_identifiers(sql, columns):
+    assert _columns(sql) == columns
+
+
+@pytest.mark.parametrize("sql, columns", [
+    ("WITH recent AS (SELECT order_id, total FROM orders) SELECT order_id FROM recent", ['order_id', 'total']),
+    (
+        "WITH paid AS (SELECT order_id, total FROM orders WHERE status = 'paid'), "
+        "big AS (SELECT order_id FROM paid WHERE total > 100) SELECT count(*) FROM big",
+        ['order_id', 'total', 'status']
+    ),
+    # ClickHouse expression aliases
+    ("WITH 10 AS lim SELECT order_id FROM orders LIMIT lim", ['order_id']),
+])
+def test_with_clause_names_are_not_columns(validator, sql, columns):
+    assert _columns(sql) == columns
+    assert validator.validate_sql(sql) == (True, "SQL validation passed")